@@ -0,0 +1,127 @@
+import multiprocessing as mp
+import traceback
+
+from BoardShape import STANDARD
+from GameState import GameState
+from SearchControl import Interrupt
+
+# the player methods a worker can be asked for, a request is the index of the
+# method in one byte followed by the position in GameState.WIRE format
+METHODS = ('play', 'get_alpha_beta_move', 'get_expectimax_move')
+# the methods after which a player with pondering on ponders (expectimax
+# plays RandomPlayer, whose reply is not worth predicting)
+PONDER_METHODS = ('play', 'get_alpha_beta_move')
+
+
+def worker_loop(player, conn):
+    """
+    Runs in the worker process: answers requests (see METHODS) with the
+    column returned by player.method and the player's SearchStats of that
+    move as a dict (None if it keeps none, (None, None) if it raised) until
+    it receives an empty message. The player object lives as long as the
+    process, so whatever it keeps between moves (transposition table,
+    history...) stays warm. A player with pondering on ponders between
+    its moves, until the next message arrives.
+    """
+    while True:
+        message = conn.recv_bytes()
+        if not message:
+            break
+        method = METHODS[message[0]]
+        state = GameState.from_wire(message[1:], getattr(player, 'shape', STANDARD))
+        # PlayerBitBoard.AI and AIPlayer read the bitboards of the state,
+        # only PlayerOld (which has no to_bitboards) needs a numpy board
+        bitboards = method == 'play' or hasattr(player, 'to_bitboards')
+        position = state if bitboards else state.board
+        try:
+            col = int(getattr(player, method)(position))
+            stats = getattr(player, 'stats', None)  # PlayerOld keeps none
+            conn.send((col, stats.to_dict() if stats is not None else None))
+        except Exception:
+            uh_oh = 'Uh oh.... something is wrong with Player {}'
+            print(uh_oh.format(player.player_number))
+            traceback.print_exc()
+            conn.send((None, None))
+            continue
+        if getattr(player, 'pondering', False) and method in PONDER_METHODS:
+            ponder(player, state, col, conn)
+
+
+def ponder(player, state, col, conn):
+    """
+    Lets the player search the position after its move col until the next
+    message arrives on conn (or it has nothing left to search).
+    """
+    state.play(col)
+    if state.last_move_won() or state.is_full():
+        return
+    try:
+        player.ponder(state.to_wire(), Interrupt(conn.poll))
+    except Exception:
+        traceback.print_exc()
+
+
+class AIWorker:
+    def __init__(self, player):
+        """
+        A long-lived process that computes the moves of one AI player, so
+        that a turn only costs sending a position in the 17 bytes of the
+        wire format (see GameState.to_wire) instead of starting a process and
+        pickling the Game.
+        """
+        self.player = player
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        self.conn, child_conn = mp.Pipe()
+        # a player searching on a pool of its own can't live in a daemonic
+        # process, Game stops the workers when its window closes anyway
+        daemon = getattr(self.player, 'splitter', None) is None
+        self.process = mp.Process(target=worker_loop,
+                                  args=(self.player, child_conn), daemon=daemon)
+        self.process.start()
+
+    def stop(self):
+        """
+        Asks the worker to exit, and kills it if it is busy.
+        """
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            try:
+                self.conn.send_bytes(b'')
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(0.1)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def cancel(self):
+        """
+        Stops the search in progress by restarting the worker, its warm
+        state is lost.
+        """
+        self.stop()
+        self.start()
+
+    def request(self, method, position, timeout=None):
+        """
+        Returns (column, stats): the column player.method (one of METHODS)
+        picks for the position, WIRE bytes from GameState.to_wire, and what
+        the search did (see SearchStats.to_dict), or (None, None) if it did
+        not answer within timeout seconds (the worker is restarted).
+        """
+        if self.process is None or not self.process.is_alive():
+            if self.process is not None:
+                self.stop()
+            self.start()
+        self.conn.send_bytes(bytes([METHODS.index(method)]) + position)
+        if not self.conn.poll(timeout):
+            self.cancel()
+            return None, None
+        return self.conn.recv()
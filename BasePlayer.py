@@ -1,5 +1,14 @@
+from BoardShape import STANDARD, popcount  # popcount is imported from here
+
+# the six playable bits and the bottom bit of every column, see the layout
+# in BasePlayer
+COLUMN_MASKS = STANDARD.column_masks
+BOTTOM_BITS = STANDARD.bottom_bits
+
 
 class BasePlayer:
+    shape = STANDARD  # the players on other boards set their own
+
     def __init__(self, name, isAI):
         """
         BasePlayer is inherited by Player.py for Human and AI, it contains
@@ -18,6 +27,7 @@ class BasePlayer:
         1  8 15 22 29 36 43
         0  7 14 21 28 35 42  BOTTOM
 
+        On another BoardShape a column takes height + 1 bits the same way.
         """
         self.name = name
         self.isAI = isAI
@@ -29,7 +39,7 @@ class BasePlayer:
         """
         Flip the bit at the x/y location.
         """
-        board.BITBOARDS[p] |= (1 << (x*7 + y))
+        board.BITBOARDS[p] |= (1 << self.shape.bit(x, y))
 
     def getNthBit(self, num, n):
         """
@@ -48,11 +58,13 @@ class BasePlayer:
         Print the bit board for a single player
 
         """
-        print(">" * 14)
-        for i in range(5, -1, -1):  # iterate backwards from 5 to 0.
-            row = " ".join(str(self.getNthBit(board, i+x*7)) for x in range(7))
+        shape = self.shape
+        print(">" * 2 * shape.width)
+        for i in range(shape.height - 1, -1, -1):  # from the top row down
+            row = " ".join(str(self.getNthBit(board, shape.bit(x, i)))
+                           for x in range(shape.width))
             print(row)
-        print("<" * 14)
+        print("<" * 2 * shape.width)
 
     def get_legal_locations(self, overall_bitboard):
         """
@@ -76,8 +88,10 @@ class BasePlayer:
 
         """
         listOfCoords = []
-        for i in range(7):  # for every column
-            for x in range(i*7, i*7+6):  # for each cell in col, from bot to top
+        column_bits, height = self.shape.column_bits, self.shape.height
+        for i in range(self.shape.width):  # for every column
+            start = i * column_bits
+            for x in range(start, start + height):  # from bot to top
                 if not self.getNthBit(overall_bitboard, x):  # get the 1st empty
                     listOfCoords.append((i, x))
                     break
@@ -89,9 +103,29 @@ class BasePlayer:
         and returns a bitboard with all the valid locations set to one.
         """
         board = 0
-        for i in range(7):
-            for x in range(i*7, i*7+6):
+        column_bits, height = self.shape.column_bits, self.shape.height
+        for i in range(self.shape.width):
+            start = i * column_bits
+            for x in range(start, start + height):
                 if not self.getNthBit(overall_bitboard, x):
                     board |= (1 << x)
                     break
         return board
+
+    def has_won(self, bitboard):
+        # taken from http://stackoverflow.com/q/7033165/1524592
+        # four in a row on the standard board, the players on other shapes
+        # use their shape's has_won instead
+        y = bitboard & (bitboard >> 6)
+        if y & (y >> 2 * 6):  # check \ diagonal
+            return True
+        y = bitboard & (bitboard >> 7)
+        if y & (y >> 2 * 7):  # check horizontal
+            return True
+        y = bitboard & (bitboard >> 8)
+        if y & (y >> 2 * 8):  # check / diagonal
+            return True
+        y = bitboard & (bitboard >> 1)
+        if y & (y >> 2):  # check vertical
+            return True
+        return False
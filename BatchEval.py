@@ -0,0 +1,86 @@
+import numpy as np
+
+BOARD_MASK = np.uint64(0xFDFBF7EFDFBF)  # the 42 playable bits
+WIN_REWARD = 9999999  # the costs of AI.evalCost
+MY_COSTS = (3000, 500, 100)
+OPP_COSTS = (1000, 500, 100)
+
+S = {k: np.uint64(k) for k in (1, 2, 3, 6, 7, 8, 12, 14, 16, 18, 21, 24)}
+
+if hasattr(np, 'bitwise_count'):  # numpy 2.0+
+    def popcount(boards):
+        return np.bitwise_count(boards).astype(np.int64)
+else:
+    BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)],
+                           dtype=np.int64)
+
+    def popcount(boards):
+        """
+        Returns the number of bits set in every board, summing a lookup
+        table over its eight bytes.
+        """
+        boards = np.ascontiguousarray(boards, dtype=np.uint64)
+        return BYTE_COUNTS[boards.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def has_won(boards):
+    """
+    Returns which of the bitboards have four in a row, see AI.has_won.
+    """
+    won = np.zeros(boards.shape, dtype=bool)
+    for shift in (1, 7, 6, 8):
+        y = boards & (boards >> S[shift])
+        won |= (y & (y >> S[2 * shift])) != 0
+    return won
+
+
+def count_lines(boards, empty):
+    """
+    Returns three arrays with how many empty cells would give each board 3, 2
+    and 1 in a row, AI.count_lines for a whole array. The bits shifted past
+    the 64th are lost, which is fine since they are masked off anyway.
+    """
+    r6, l6 = boards >> S[6], boards << S[6]
+    r7, l7 = boards >> S[7], boards << S[7]
+    r8, l8 = boards >> S[8], boards << S[8]
+    l1 = boards << S[1]
+    l2 = boards << S[2]
+
+    rr7, rl7, ll7 = r7 & (boards >> S[14]), r7 & l7, l7 & (boards << S[14])
+    rr8, rl8, ll8 = r8 & (boards >> S[16]), r8 & l8, l8 & (boards << S[16])
+    rr6, rl6, ll6 = r6 & (boards >> S[12]), r6 & l6, l6 & (boards << S[12])
+    vertical2 = l1 & l2
+
+    three = (rr7 & ((boards >> S[21]) | l7) | ll7 & ((boards << S[21]) | r7)
+             | rr8 & ((boards >> S[24]) | l8) | ll8 & ((boards << S[24]) | r8)
+             | rr6 & ((boards >> S[18]) | l6) | ll6 & ((boards << S[18]) | r6)
+             | vertical2 & (boards << S[3]))
+    two = rr7 | rl7 | ll7 | rr8 | rl8 | ll8 | rr6 | rl6 | ll6 | vertical2
+    one = r7 | l7 | l1
+
+    return (popcount(empty & three), popcount(empty & two),
+            popcount(empty & one))
+
+
+def evaluate(my_boards, opp_boards):
+    """
+    Returns AI.evalCost(b, opp_board, my_board, ...) of every pair of
+    bitboards as an int64 array, computing the whole array with a few dozen
+    numpy operations instead of one Python call per position.
+    my_boards and opp_boards are sequences (or arrays) of the same length.
+    """
+    my_boards = np.asarray(my_boards, dtype=np.uint64)
+    opp_boards = np.asarray(opp_boards, dtype=np.uint64)
+    n = len(my_boards)
+    # both sides go through count_lines and has_won as one array
+    boards = np.concatenate((my_boards, opp_boards))
+    empty = ~(my_boards | opp_boards) & BOARD_MASK
+    threes, twos, ones = count_lines(boards, np.concatenate((empty, empty)))
+
+    values = (MY_COSTS[0] * threes[:n] - OPP_COSTS[0] * threes[n:]
+              + MY_COSTS[1] * twos[:n] - OPP_COSTS[1] * twos[n:]
+              + MY_COSTS[2] * ones[:n] - OPP_COSTS[2] * ones[n:])
+    won = has_won(boards)
+    values[won[:n]] = WIN_REWARD
+    values[won[n:]] = -WIN_REWARD  # checked first by evalCost
+    return values
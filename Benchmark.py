@@ -0,0 +1,294 @@
+# system libs
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+from time import perf_counter
+
+# Local libs
+import BatchEval
+from GameState import GameState
+from OpeningBook import open_book
+from Player import AIPlayer, WindowCounter, cell_bits
+from PlayerBitBoard import AI
+from PlayerOld import AIPlayer as OldAIPlayer
+from SearchControl import DRIVERS
+from SearchStats import SearchStats
+from Symmetry import canonical
+from TranspositionTable import TranspositionTable
+
+# fixed positions as the columns played from the empty board, none of them
+# is won yet and in the endgames neither player can win on the next move
+CORPUS = {
+    'opening': ['', '3', '33', '3324'],
+    'middlegame': ['600133320334', '36332402654235', '3442523104341316',
+                   '434525534444056156'],
+    'endgame': ['030451465625321430234224266500',
+                '05234321256161623236031605304654',
+                '10311661331030256464561453430552'],
+}
+
+# engine -> depth searched when --depth is not given
+DEPTHS = {
+    'ai-alphabeta': 4,
+    'ai-expectimax': 5,
+    'bitboard-tree': 7,
+    'bitboard-negamax': 7,
+    'bitboard-parallel': 7,  # one process per core, started with the search
+    'old-alphabeta': 4,  # hard-coded in PlayerOld, --depth does not apply
+}
+
+
+def position(moves):
+    state = GameState()
+    for col in moves:
+        state.play(int(col))
+    return state
+
+
+def run_engine(engine, state, depth, pvs=False, driver='alphabeta'):
+    """
+    Searches the position with the engine at a fixed depth and returns the
+    chosen column and the SearchStats of the search. pvs and driver are
+    handed to the alpha-beta engines, see SearchControl.windowed_search.
+    """
+    player_number = state.current_turn + 1
+    if engine in ('ai-alphabeta', 'ai-expectimax'):
+        player = AIPlayer(player_number, pvs=pvs, driver=driver)
+        root = player.to_bitboards(state.board)
+        if engine == 'ai-alphabeta':
+            col = player.alpha_beta_search(root, depth)
+        else:
+            col = player.expectimax_search(root, depth)
+        return col, player.stats
+    elif engine.startswith('bitboard-'):
+        ai = AI(player_number, search_mode=engine.split('-')[1], pvs=pvs,
+                driver=driver)
+        my_board = state.BITBOARDS[state.current_turn]
+        opp_board = state.BITBOARDS[not state.current_turn]
+        try:
+            return ai.search_depth(state, my_board, opp_board, depth), ai.stats
+        finally:
+            if ai.splitter is not None:
+                ai.splitter.close()
+    player = OldAIPlayer(player_number)
+    col = player.get_alpha_beta_move(state.board)
+    stats = SearchStats()  # PlayerOld only counts its nodes
+    stats.nodes = player.ab_count
+    return col, stats
+
+
+def bench_engines(engines, depth=None, pvs=False, driver='alphabeta'):
+    results = []
+    for engine in engines:
+        engine_depth = DEPTHS[engine] if depth is None or engine == 'old-alphabeta' else depth
+        for phase, positions in sorted(CORPUS.items()):
+            for moves in positions:
+                state = position(moves)
+                start = perf_counter()
+                col, stats = run_engine(engine, state, engine_depth, pvs,
+                                        driver)
+                seconds = perf_counter() - start
+                nodes = stats.nodes
+                results.append({
+                    'engine': engine,
+                    'phase': phase,
+                    'position': moves,
+                    'depth': engine_depth,
+                    'pvs': pvs,
+                    'driver': driver,
+                    'column': int(col),
+                    'nodes': nodes,
+                    'leaves': stats.leaves,
+                    'cutoffs': stats.cutoffs,
+                    'first_move_cutoff_rate': stats.first_move_cutoff_rate(),
+                    'hits': stats.hits,
+                    'seconds': seconds,
+                    'nodes_per_second': nodes / seconds if seconds else 0.0,
+                })
+                print('{engine:17} {phase:10} {position:36} depth {depth} '
+                      'col {column} {nodes:8} nodes {seconds:8.3f}s '
+                      '{nodes_per_second:10.0f} nodes/s'.format(**results[-1]))
+    return results
+
+
+def time_call(func):
+    """
+    Returns the time of one call to func in nanoseconds.
+    """
+    number, seconds = timeit.Timer(func).autorange()
+    return seconds / number * 1e9
+
+
+def legacy_evalCost(ai, opp_board, my_board):
+    """
+    AI.evalCost as it was before it shared the shifts between evaluate3,
+    evaluate2 and evaluate1 and counted bits natively, to check the scores
+    of the new one against.
+    """
+    if ai.has_won(opp_board):
+        return -9999999
+    elif ai.has_won(my_board):
+        return 9999999
+    return ai.bitboard_bits(ai.evaluate3(opp_board, my_board)) * 3000 \
+        - ai.bitboard_bits(ai.evaluate3(my_board, opp_board)) * 1000 \
+        + ai.bitboard_bits(ai.evaluate2(opp_board, my_board)) * 500 \
+        - ai.bitboard_bits(ai.evaluate2(my_board, opp_board)) * 500 \
+        + ai.bitboard_bits(ai.evaluate1(opp_board, my_board)) * 100 \
+        - ai.bitboard_bits(ai.evaluate1(my_board, opp_board)) * 100
+
+
+def random_positions(count, seed=0):
+    """
+    Returns the bitboards of count positions from random games.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        state = GameState()
+        for _ in range(rng.randrange(42)):
+            state.play(rng.choice([c for c in range(7) if state.can_play(c)]))
+            if state.last_move_won():
+                break
+        positions.append(tuple(state.BITBOARDS))
+    return positions
+
+
+def bench_evalcost(count=1000):
+    """
+    Scores the corpus and count random positions (both players' view) with
+    AI.evalCost, legacy_evalCost and BatchEval.evaluate, and times them over
+    all of them (the batch in a single call).
+    """
+    ai = AI(1)
+    positions = [tuple(position(moves).BITBOARDS)
+                 for phases in CORPUS.values() for moves in phases]
+    positions += random_positions(count)
+    pairs = positions + [(b, a) for (a, b) in positions]
+    mismatches = sum(ai.evalCost(None, opp, my, True) !=
+                     legacy_evalCost(ai, opp, my) for (my, opp) in pairs)
+    my_boards, opp_boards = zip(*pairs)
+    batch = BatchEval.evaluate(my_boards, opp_boards).tolist()
+    mismatches += sum(value != ai.evalCost(None, opp, my, True)
+                      for (value, (my, opp)) in zip(batch, pairs))
+    new = time_call(lambda: [ai.evalCost(None, opp, my, True)
+                             for (my, opp) in pairs]) / len(pairs)
+    old = time_call(lambda: [legacy_evalCost(ai, opp, my)
+                             for (my, opp) in pairs]) / len(pairs)
+    batch = time_call(lambda: BatchEval.evaluate(my_boards, opp_boards)) \
+        / len(pairs)
+    results = {'positions': len(pairs), 'mismatches': mismatches,
+               'legacy_ns': old, 'new_ns': new, 'speedup': old / new,
+               'batch_ns': batch}
+    print('evalCost: {positions} positions, {mismatches} mismatches, '
+          '{legacy_ns:.0f} ns -> {new_ns:.0f} ns ({speedup:.1f}x), '
+          'batched {batch_ns:.0f} ns'.format(**results))
+    return results
+
+
+# the modules a short-lived engine or worker process starts with, each must
+# import within IMPORT_BUDGET_MS in a fresh interpreter without pulling in any
+# of HEAVY_MODULES (ConnectFour only loads them for a GUI game)
+IMPORT_CHECKS = ('Engine', 'PlayerBitBoard', 'Player', 'ConnectFour')
+IMPORT_BUDGET_MS = 10.0
+HEAVY_MODULES = ('numpy', 'tkinter', 'multiprocessing')
+IMPORT_PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+print(' '.join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+
+def bench_imports(repeat=5):
+    """
+    Imports each of IMPORT_CHECKS in repeat fresh interpreters and returns
+    its best time in milliseconds, the heavy modules it loaded and whether it
+    is within the budget.
+    """
+    results = {}
+    for module in IMPORT_CHECKS:
+        probe = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+        times = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, '-c', probe], check=True,
+                                 capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+            lines = out.stdout.split('\n')
+            times.append(float(lines[0]))
+        heavy = lines[1].split()
+        results[module] = {
+            'ms': min(times),
+            'heavy_modules': heavy,
+            'within_budget': min(times) <= IMPORT_BUDGET_MS and not heavy,
+        }
+        print('import {:15} {:6.1f} ms {}{}'.format(
+            module, min(times), ' '.join(heavy),
+            '' if results[module]['within_budget'] else ' OVER BUDGET'))
+    return results
+
+
+def bench_primitives(moves=CORPUS['middlegame'][1]):
+    """
+    Times the building blocks of the searches on one middlegame position.
+    """
+    state = position(moves)
+    ai = AI(1)
+    player = AIPlayer(1)
+    my_board, opp_board = state.BITBOARDS
+    node = player.to_bitboards(state.board)
+    counter = WindowCounter(player.windows, node)
+    col = next(c for c in range(7) if state.can_play(c))
+    move = 1 << cell_bits[5 - state.heights[col]][col]
+    primitives = {
+        'has_won': lambda: ai.has_won(my_board),
+        'evalCost': lambda: ai.evalCost(None, opp_board, my_board, True),
+        'get_legal_locations': lambda: ai.get_legal_locations(my_board | opp_board),
+        'generate_moves': lambda: player.generate_moves(node, 1),
+        'check_win': lambda: player.check_win(node),
+        'score_board': lambda: player.score_board(node, 0, 1),
+        'canonical_key': lambda: canonical(TranspositionTable.key(my_board,
+                                                                  opp_board)),
+        'window_make_unmake': lambda: (counter.make(move, 1),
+                                       counter.unmake(move, 1)),
+    }
+    book = open_book()
+    if book is not None:
+        primitives['book_lookup'] = lambda: book.lookup(my_board, opp_board)
+    results = {}
+    for name, func in primitives.items():
+        results[name] = time_call(func)
+        print('{:20} {:10.0f} ns'.format(name, results[name]))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engines', nargs='+', choices=sorted(DEPTHS),
+                        default=sorted(DEPTHS))
+    parser.add_argument('--depth', type=int, default=None,
+                        help='Depth for every engine (default: per engine)')
+    parser.add_argument('--pvs', action='store_true',
+                        help='Principal variation search in the alpha-beta engines')
+    parser.add_argument('--driver', choices=DRIVERS, default='alphabeta',
+                        help='How the alpha-beta engines search the root')
+    parser.add_argument('--skip-engines', action='store_true',
+                        help='Only run the primitive microbenchmarks')
+    parser.add_argument('--out', default='benchmark.json',
+                        help='File to write the results to')
+    args = parser.parse_args()
+
+    results = {'python': platform.python_version()}
+    if not args.skip_engines:
+        results['engines'] = bench_engines(args.engines, args.depth, args.pvs,
+                                           args.driver)
+    results['imports'] = bench_imports()
+    results['primitives'] = bench_primitives()
+    results['evalCost'] = bench_evalcost()
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
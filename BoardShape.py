@@ -0,0 +1,166 @@
+try:
+    popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+    def popcount(bitboard):
+        return bin(bitboard).count('1')
+
+
+class BoardShape:
+    def __init__(self, width=7, height=6, connect=4):
+        """
+        The size of the board and how many tokens in a row win, and the
+        bitboard masks and shifts that follow from them. The layout is
+        BasePlayer's for any size: column c takes the height + 1 bits from
+        c * (height + 1) up, bottom first, the spare bit on top keeping the
+        columns apart so that no line runs from the top of one column into
+        the bottom of the next.
+
+        The engines keep their unrolled code for the standard 7x6 board with
+        four in a row and use the generic line tests below on other shapes.
+        Python ints have no width, so a board of more than 64 bits works the
+        same; only the 64-bit wire format needs fits_64. BatchEval and the
+        opening book are for STANDARD.
+        """
+        # no line of connect would fit, nobody could ever win
+        if width < 1 or height < 1 or connect < 2 or connect > max(width, height):
+            raise ValueError('Not a board: {}x{}, connect {}'.format(
+                width, height, connect))
+        self.width = width
+        self.height = height
+        self.connect = connect
+        self.cells = width * height
+        self.column_bits = height + 1
+        self.bits = width * self.column_bits
+        self.fits_64 = self.bits <= 64
+        self.board_bytes = (self.bits + 7) // 8
+        # vertical, \ diagonal, horizontal, / diagonal
+        self.shifts = (1, height, height + 1, height + 2)
+        self.bottom_bits = tuple(1 << (col * self.column_bits)
+                                 for col in range(width))
+        self.column_masks = tuple(((1 << height) - 1) << (col * self.column_bits)
+                                  for col in range(width))
+        self.bottom_mask = sum(self.bottom_bits)
+        self.board_mask = sum(self.column_masks)
+        # the columns left of the center and the center one
+        self.left_half = sum(self.column_masks[:(width + 1) // 2])
+        # center columns take part in more lines
+        self.center_order = tuple(sorted(range(width),
+                                         key=lambda c: (abs(2 * c - width + 1), c)))
+
+        # has_won doubles the runs it looks for: for four in a row, 2 then 4
+        steps, length = [], 1
+        while length < connect:
+            steps.append(min(length, connect - length))
+            length += steps[-1]
+        self.win_steps = tuple(steps)
+        self.win_shifts = tuple(tuple(step * shift for step in steps)
+                                for shift in self.shifts)
+        # the cells finishing a line of connect, then of connect - 1... (see
+        # line_patterns), the ones count_lines counts
+        self.win_patterns = self.line_patterns(connect - 1)
+        self.levels = [self.line_patterns(tokens, diagonals=tokens > 1)
+                       for tokens in range(connect - 1, max(0, connect - 4), -1)]
+
+    def line_patterns(self, tokens, diagonals=True):
+        """
+        Returns the ways an empty cell can make a line of tokens + 1 with
+        tokens of one player, as tuples of offsets in bits from the cell to
+        those tokens. Vertically only the cell on top of them counts, the
+        others can't be played before it; diagonals=False skips diagonals.
+        """
+        patterns = [tuple(-i for i in range(1, tokens + 1))]  # vertical
+        for shift in self.shifts[1:]:
+            if not diagonals and shift != self.column_bits:
+                continue
+            for first in range(-tokens, 1):  # offset of the line's first cell
+                patterns.append(tuple(i * shift for i in range(first, first + tokens + 1)
+                                      if i != 0))
+        return patterns
+
+    @staticmethod
+    def line_cells(bitboard, patterns):
+        """
+        Returns the cells (as a bitboard, the occupied and off the board ones
+        included) that make one of the patterns with the tokens of bitboard.
+        Each shift of bitboard is computed once.
+        """
+        shifted = {}
+        cells = 0
+        for offsets in patterns:
+            term = -1
+            for offset in offsets:
+                board = shifted.get(offset)
+                if board is None:
+                    board = bitboard >> offset if offset > 0 else bitboard << -offset
+                    shifted[offset] = board
+                term &= board
+            cells |= term
+        return cells
+
+    def has_won(self, bitboard):
+        for shifts in self.win_shifts:
+            y = bitboard
+            for shift in shifts:
+                y &= y >> shift
+            if y:
+                return True
+        return False
+
+    def winning_cells(self, bitboard, mask):
+        """
+        Returns the empty cells (playable or not yet) that would give the
+        owner of bitboard a line of connect, like Solver.winning_cells.
+        """
+        return self.line_cells(bitboard, self.win_patterns) & (self.board_mask ^ mask)
+
+    def count_lines(self, my_board, empty):
+        """
+        Returns how many empty cells would give my_board a line of connect,
+        connect - 1 and connect - 2 (0 for the ones shorter than 2), like
+        PlayerBitBoard.AI.count_lines does for four in a row. empty is the
+        mask of the empty playable cells.
+        """
+        counts = [popcount(empty & self.line_cells(my_board, patterns))
+                  for patterns in self.levels]
+        return tuple(counts + [0] * (3 - len(counts)))
+
+    def mirror(self, bitboard):
+        """
+        Returns the bitboard flipped left to right, like Symmetry.mirror.
+        """
+        column = (1 << self.column_bits) - 1
+        mirrored = 0
+        for col in range(self.width):
+            bits = (bitboard >> (col * self.column_bits)) & column
+            mirrored |= bits << ((self.width - 1 - col) * self.column_bits)
+        return mirrored
+
+    def mirror_col(self, col):
+        return self.width - 1 - col if col >= 0 else col
+
+    def bit(self, col, row):
+        """
+        Returns the index of the bit of the cell, row 0 being the bottom.
+        """
+        return col * self.column_bits + row
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, BoardShape) and
+                                 (self.width, self.height, self.connect) ==
+                                 (other.width, other.height, other.connect))
+
+    def __hash__(self):
+        return hash((self.width, self.height, self.connect))
+
+    def __repr__(self):
+        return 'BoardShape({}, {}, {})'.format(self.width, self.height, self.connect)
+
+    def __getstate__(self):
+        return self.width, self.height, self.connect
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+STANDARD = BoardShape()  # the 7x6 connect four board
+
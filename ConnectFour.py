@@ -1,96 +1,130 @@
 # system libs
-import argparse
-import multiprocessing as mp
-import tkinter as tk
-
-# 3rd party libs
-import numpy as np
+from time import perf_counter
 
 # Local libs
-from PlayerBitBoard import AI
-from Player import AIPlayer, RandomPlayer, HumanPlayer
-
+from BoardShape import STANDARD
+from GameState import GameState
 
-# https://stackoverflow.com/a/37737985
-def turn_worker(board, send_end, p_func):
-    send_end.send(p_func(board))
+# tkinter, numpy, the worker processes and the players are imported where
+# they are needed: a headless game never loads tkinter, and importing this
+# module (as the pool processes of Tournament do) stays cheap
 
 
 class Game:
-    def __init__(self, player1, player2, time):
+    def __init__(self, player1, player2, time, headless=False, shape=STANDARD):
+        """
+        Opens the window and waits for "Next Move" clicks. A headless game
+        has no window: call play() to run it to the end. Its AI moves are
+        computed in the calling process, so games can run in a process pool.
+        shape is the BoardShape played on, the AI players must be given the
+        same one.
+        """
         self.players = [player1, player2]
         self.colors = ['yellow', 'red']
-        self.current_turn = 0
 
-        self.board = np.zeros([6, 7]).astype(np.uint8)
-        self.BITBOARDS = [0, 0]
+        # the one source of truth for the position, see board and BITBOARDS
+        self.state = GameState(shape)
+        self.shape = shape
 
         self.gui_board = []
         self.game_over = False
+        self.winner = None  # player number of the winner, 0 for a draw
+        self.move_times = []  # (player number, column, seconds) of each move
+        # (player number, SearchStats.to_dict() or None) of each AI move
+        self.move_stats = []
         self.ai_turn_limit = time
+        self.headless = headless
+        # one long-lived worker process per AI player, started on its 1st move
+        self.workers = [None, None]
+        if headless:
+            return
+
+        import tkinter as tk
+        from AIWorker import AIWorker
 
+        self.workers = [AIWorker(p) if p.type == 'ai' else None
+                        for p in self.players]
         # https://stackoverflow.com/a/38159672
         root = tk.Tk()
-        root.title('Connect 4')
+        root.title('Connect {}'.format(shape.connect))
         self.player_string = tk.Label(root, text=player1.player_string)
         self.player_string.pack()
-        self.c = tk.Canvas(root, width=700, height=600)
+        self.c = tk.Canvas(root, width=shape.width * 100, height=shape.height * 100)
         self.c.pack()
 
-        for row in range(0, 700, 100):
+        for row in range(0, shape.width * 100, 100):
             column = []
-            for col in range(0, 700, 100):
+            for col in range(0, shape.height * 100, 100):
                 column.append(self.c.create_oval(row, col, row + 100, col + 100, fill=''))
             self.gui_board.append(column)
 
         tk.Button(root, text='Next Move', command=self.make_move).pack()
 
         root.mainloop()
-
-    def place_token(self, col):
-        if col < 0:  # invalid column
-            return False
-        transposed_board = (list(map(list, zip(*self.board))))
-        piece_col = list(reversed(transposed_board[col]))
-        y = 0
-        for piece in piece_col:
-            if not piece:  # if the column has an empty space
-                self.players[self.current_turn].flipBit(self, self.current_turn, col, y)
-                return
-            y += 1
-        return  # if the column is full, return False
+        self.stop_workers()
+
+    @property
+    def board(self):
+        """
+        The numpy board (row 0 is the top), built lazily for the players
+        that need it.
+        """
+        return self.state.board
+
+    @property
+    def BITBOARDS(self):
+        return self.state.BITBOARDS
+
+    @property
+    def current_turn(self):
+        return self.state.current_turn
+
+    def play(self):
+        """
+        Makes moves until the game is over and returns the winner's player
+        number (0 for a draw).
+        """
+        while not self.game_over:
+            self.make_move()
+        return self.winner
+
+    def set_status(self, text):
+        if not self.headless:
+            self.player_string.configure(text=text)
+
+    def stop_workers(self):
+        for worker in self.workers:
+            if worker is not None:
+                worker.stop()
 
     def make_move(self):
         if not self.game_over:
             current_player = self.players[self.current_turn]
 
             if current_player.type == 'ai':
-                if self.players[int(not self.current_turn)].type == 'random':
-                    p_func = current_player.get_expectimax_move  # TODO Change this back to hand in just board
-                    var = self.board
-                elif isinstance(current_player, AI):
-                    p_func = current_player.play
-                    var = self
+                if hasattr(current_player, 'play'):  # PlayerBitBoard.AI
+                    method = 'play'
+                elif self.players[int(not self.current_turn)].type == 'random':
+                    method = 'get_expectimax_move'
                 else:
-                    p_func = current_player.get_alpha_beta_move  # TODO Change this back to hand in just board
-                    var = self.board
-                try:
-                    recv_end, send_end = mp.Pipe(False)
-                    p = mp.Process(target=turn_worker,
-                                   args=(var, send_end, p_func))  # TODO Change this back to hand in just board
-                    p.start()
-                    p.join(self.ai_turn_limit)
-                except Exception as e:
-                    uh_oh = 'Uh oh.... something is wrong with Player {}'
-                    print(uh_oh.format(current_player.player_number))
-                    print(e.with_traceback())
-
-                move = recv_end.recv()
+                    method = 'get_alpha_beta_move'
+                worker = self.workers[self.current_turn]
+                start = perf_counter()
+                if worker is not None:
+                    move, stats = worker.request(method, self.state.to_wire(),
+                                                 self.ai_turn_limit)
+                else:  # headless, the bitboard engines read the game itself
+                    bitboards = method == 'play' or hasattr(current_player, 'to_bitboards')
+                    position = self if bitboards else self.board
+                    move = getattr(current_player, method)(position)
+                    stats = getattr(current_player, 'stats', None)
+                    stats = stats.to_dict() if stats is not None else None
+                self.move_stats.append((current_player.player_number, stats))
             else:
+                start = perf_counter()
                 move = current_player.get_move(self.board)
-
-            if move >= 0 and isinstance(current_player, AI):  # TODO Change this back to hand in just board
-                self.place_token(move)
+            self.move_times.append((current_player.player_number, move,
+                                    perf_counter() - start))
 
             if move is not None:
                 self.update_board(int(move), current_player.player_number)
@@ -99,67 +133,42 @@ class Game:
 
             if self.game_completed(current_player.player_number):
                 self.game_over = True
-                self.player_string.configure(text=self.players[self.current_turn].player_string + ' wins!')
+                self.winner = current_player.player_number
+                self.stop_workers()
+                self.set_status(current_player.player_string + ' wins!')
+            elif self.state.is_full():
+                self.game_over = True
+                self.winner = 0
+                self.stop_workers()
+                self.set_status('Draw!')
             else:
-                self.current_turn = int(not self.current_turn)
-                self.player_string.configure(text=self.players[self.current_turn].player_string)
+                self.set_status(self.players[self.current_turn].player_string)
 
     def update_board(self, move, player_num):
-        if 0 in self.board[:, move]:
-            update_row = -1
-            for row in range(1, self.board.shape[0]):
-                update_row = -1
-                if self.board[row, move] > 0 and self.board[row - 1, move] == 0:
-                    update_row = row - 1
-                elif row == self.board.shape[0] - 1 and self.board[row, move] == 0:
-                    update_row = row
-
-                if update_row >= 0:
-                    self.board[update_row, move] = player_num
-                    self.c.itemconfig(self.gui_board[move][update_row],
-                                      fill=self.colors[self.current_turn])
-                    break
+        """
+        Plays the move for the player to move (which also passes the turn)
+        and colors its token.
+        """
+        if self.state.can_play(move):
+            color = self.colors[self.current_turn]
+            row = self.state.play(move)
+            if not self.headless:
+                self.c.itemconfig(self.gui_board[move][self.shape.height - 1 - row],
+                                  fill=color)
         else:
             err = 'Invalid move by player {}. Column {}'.format(player_num, move)
             raise Exception(err)
 
     def game_completed(self, player_num):
-        player_win_str = '{0}{0}{0}{0}'.format(player_num)
-        board = self.board
-        to_str = lambda a: ''.join(a.astype(str))
-
-        def check_horizontal(b):
-            for row in b:
-                if player_win_str in to_str(row):
-                    return True
-            return False
-
-        def check_verticle(b):
-            return check_horizontal(b.T)
-
-        def check_diagonal(b):
-            for op in [None, np.fliplr]:
-                op_board = op(b) if op else b
+        """
+        Returns whether the last move gave player_num four (connect) in a
+        row.
+        """
+        return self.state.has_won(player_num - 1)
 
-                root_diag = np.diagonal(op_board, offset=0).astype(np.int)
-                if player_win_str in to_str(root_diag):
-                    return True
 
-                for i in range(1, b.shape[1] - 3):
-                    for offset in [i, -i]:
-                        diag = np.diagonal(op_board, offset=offset)
-                        diag = to_str(diag.astype(np.int))
-                        if player_win_str in diag:
-                            return True
-
-            return False
-
-        return (check_horizontal(board) or
-                check_verticle(board) or
-                check_diagonal(board))
-
-
-def main(player1, player2, time):
+def main(player1, player2, time, headless=False, processes=1, ponder=False,
+         shape=STANDARD):
     """
     Creates player objects based on the string paramters that are passed
     to it and calls play_game()
@@ -167,17 +176,29 @@ def main(player1, player2, time):
     INPUTS:
     player1 - a string ['ai', 'random', 'human']
     player2 - a string ['ai', 'random', 'human']
+    headless - play without a window and print the result
+    processes - number of processes each AI searches with
+    ponder - let the AIs search on their opponent's time (GUI games only)
+    shape - the BoardShape to play on
     """
 
     def make_player(name, num):
+        from Player import AIPlayer, RandomPlayer, HumanPlayer
+
         if name == 'ai':
-            return AIPlayer(num)  # TODO Change this back to hand in just board
+            return AIPlayer(num, time, processes=processes, pondering=ponder,
+                            shape=shape)
         elif name == 'random':
             return RandomPlayer(num)
         elif name == 'human':
-            return HumanPlayer(num)
+            return HumanPlayer(num, shape)
 
-    Game(make_player(player1, 1), make_player(player2, 2), time)
+    game = Game(make_player(player1, 1), make_player(player2, 2), time, headless,
+                shape)
+    if headless:
+        winner = game.play()
+        print('Draw' if not winner else 'Player {} wins'.format(winner))
+        print('Moves: {}'.format(game.state.moves))
 
 
 def play_game(player1, player2):
@@ -191,10 +212,14 @@ def play_game(player1, player2):
     RETURNS:
     None
     """
+    import numpy as np
+
     board = np.zeros([6, 7])
 
 
 if __name__ == '__main__':
+    import argparse
+
     player_types = ['ai', 'random', 'human']
     parser = argparse.ArgumentParser()
     parser.add_argument('player1', choices=player_types)
@@ -203,6 +228,29 @@ if __name__ == '__main__':
                         type=int,
                         default=60,
                         help='Time to wait for a move in seconds (int)')
+    parser.add_argument('--headless',
+                        action='store_true',
+                        help='Play without a window, printing the result')
+    parser.add_argument('--processes',
+                        type=int,
+                        default=1,
+                        help='Processes each AI searches with (int)')
+    parser.add_argument('--ponder',
+                        action='store_true',
+                        help='Let the AIs think on their opponent\'s time')
+    parser.add_argument('--width', type=int, default=7,
+                        help='Columns of the board (int)')
+    parser.add_argument('--height', type=int, default=6,
+                        help='Rows of the board (int)')
+    parser.add_argument('--connect', type=int, default=4,
+                        help='Tokens in a row that win (int)')
     args = parser.parse_args()
 
-    main(args.player1, args.player2, args.time)
+    from BoardShape import BoardShape
+
+    try:
+        shape = BoardShape(args.width, args.height, args.connect)
+    except ValueError as e:
+        parser.error(str(e))
+    main(args.player1, args.player2, args.time, args.headless, args.processes,
+         args.ponder, shape)
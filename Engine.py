@@ -0,0 +1,99 @@
+# system libs
+import sys
+
+# Local libs
+from BoardShape import STANDARD, BoardShape
+from GameState import GameState
+
+# Asks an engine for one move without a window or worker process, e.g.
+#     python Engine.py bitboard 3324 --time 1
+# prints the column the bitboard engine plays after the moves 3, 3, 2, 4.
+# Nothing heavy is imported up front and the engines are handed the wire
+# format, so neither loads numpy or tkinter and a call costs little more than
+# the search itself.
+
+ENGINES = ('bitboard', 'ai')
+
+
+def make_engine(name, player_number, time_limit=None, stats_path=None,
+                shape=STANDARD):
+    """
+    Returns a new engine: 'bitboard' for PlayerBitBoard.AI, 'ai' for
+    Player.AIPlayer, playing on a board of the shape.
+    """
+    if name == 'bitboard':
+        from PlayerBitBoard import AI
+        return AI(player_number, time_limit=time_limit, stats_path=stats_path,
+                  shape=shape)
+    from Player import AIPlayer
+    return AIPlayer(player_number, time_limit, stats_path=stats_path, shape=shape)
+
+
+def position(moves, shape=STANDARD):
+    """
+    Returns the GameState after the moves, a string of column digits, or of
+    the hex encoded wire format position (see GameState.to_wire) if it
+    starts with 'x'.
+    """
+    if moves.startswith('x'):
+        return GameState.from_wire(bytes.fromhex(moves[1:]), shape)
+    state = GameState(shape)
+    for col in moves:
+        col = int(col)
+        if not state.can_play(col) or state.last_move_won():
+            raise ValueError('Illegal move {} in {}'.format(col, moves))
+        state.play(col)
+    return state
+
+
+def best_move(engine, state):
+    """
+    Returns (column, SearchStats) of the engine's move in the GameState.
+    Both engines are handed the wire format, so AIPlayer gets by without
+    numpy too.
+    """
+    if hasattr(engine, 'play'):  # PlayerBitBoard.AI
+        col = engine.play(state.to_wire())
+    else:
+        col = engine.get_alpha_beta_move(state.to_wire())
+    return int(col), engine.stats
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('engine', choices=ENGINES)
+    parser.add_argument('moves', nargs='?', default='',
+                        help='The columns played so far, e.g. 3324, or x and '
+                             'the position in hex wire format')
+    parser.add_argument('--time', type=float, default=None,
+                        help='Turn limit in seconds (default: fixed depth)')
+    parser.add_argument('--stats', action='store_true',
+                        help='Also print the search statistics as JSON')
+    parser.add_argument('--width', type=int, default=7,
+                        help='Columns of the board (int)')
+    parser.add_argument('--height', type=int, default=6,
+                        help='Rows of the board (int)')
+    parser.add_argument('--connect', type=int, default=4,
+                        help='Tokens in a row that win (int)')
+    args = parser.parse_args(argv)
+
+    try:
+        shape = BoardShape(args.width, args.height, args.connect)
+        state = position(args.moves, shape)
+    except ValueError as e:
+        parser.error(str(e))
+    if state.last_move_won() or state.is_full():
+        parser.error('the game is over')
+    engine = make_engine(args.engine, state.current_turn + 1, args.time,
+                         shape=shape)
+    col, stats = best_move(engine, state)
+    print(col)
+    if args.stats:
+        import json
+        print(json.dumps(stats.to_dict()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+from TranspositionTable import TranspositionTable
+
+
+class Expectimax:
+    def __init__(self, player, memo=None, deadline=None):
+        """
+        An expectimax search on the (player 1, player 2) bitboards of
+        Player.AIPlayer, for games against RandomPlayer: our moves maximise,
+        and the opponent's are chance nodes where every legal reply is
+        equally likely (each weighs 1 / the number of replies).
+
+        player is the AIPlayer whose evaluation_function scores the leaves.
+        memo maps (position, depth) to the value found, pass the same dict
+        to the searches of one move so the iterations of iterative deepening
+        share it. Mirror images are not merged: AIPlayer's scores are not
+        exactly symmetric.
+        deadline is an optional SearchControl.Deadline.
+        """
+        self.player = player
+        self.memo = memo if memo is not None else {}
+        self.deadline = deadline
+        self.nodes = 0  # number of positions searched
+        self.leaves = 0  # positions scored by evaluation_function
+        # there is nothing to cut off in an expectimax search
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hits = 0  # positions found in the memo
+
+    def search(self, root, depth, first_col=-1):
+        """
+        Returns (column, value) of the move with the highest expected value,
+        searching depth plies. first_col is searched first and wins ties.
+        """
+        me = self.player.player_number
+        turns = self.player.generate_moves(root, me)
+        turns.sort(key=lambda turn: turn[0] != first_col)
+        best_col, best_value = turns[0][0], -float('inf')
+        for (col, node, move) in turns:
+            value = self.value(node, depth - 1, 1, 3 - me, move)
+            if value > best_value:
+                best_col, best_value = col, value
+        return best_col, best_value
+
+    def value(self, node, depth, level, player, last_move):
+        """
+        Returns the expected value of node for the AI, player being the one
+        to move and last_move the bit of the token the other one dropped.
+        """
+        self.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        ai = self.player
+        winner = ai.check_last_move(node, last_move, 3 - player)
+        if winner > 0:
+            self.leaves += 1
+            return ai.evaluation_function(node, level, ai.player_number, winner)
+
+        # the leaves are memoized too, they are reached by the most move orders
+        key = TranspositionTable.key(node[0], node[1])
+        value = self.memo.get((key, depth))
+        if value is not None:
+            self.hits += 1
+            return value
+        if depth == 0:
+            self.leaves += 1
+            value = ai.evaluation_function(node, level, ai.player_number, 0)
+            self.memo[key, 0] = value
+            return value
+
+        p1, p2 = node
+        mask = p1 | p2
+        values = []
+        shape = ai.shape
+        for col in range(shape.width):
+            move = (mask + shape.bottom_bits[col]) & shape.column_masks[col]
+            if move:
+                child = (p1 | move, p2) if player == 1 else (p1, p2 | move)
+                values.append(self.value(child, depth - 1, level + 1,
+                                         3 - player, move))
+        if not values:  # the board is full
+            self.leaves += 1
+            value = ai.evaluation_function(node, level, ai.player_number, 0)
+        elif player == ai.player_number:
+            value = max(values)
+        else:  # the random player picks any of its replies
+            value = sum(values) / len(values)
+        self.memo[key, depth] = value
+        return value
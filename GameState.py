@@ -0,0 +1,153 @@
+import struct
+
+from BoardShape import STANDARD
+
+# the wire format of a position (see GameState.to_wire): the bitboards of
+# player 1 and player 2 as little endian 64-bit integers and the side to move
+# (0 for player 1), optionally followed by the columns played, a byte each.
+# The bitboards of a shape that does not fit in 64 bits take board_bytes
+# bytes each instead
+WIRE = struct.Struct('<QQB')
+
+
+def wire_size(shape):
+    """
+    Returns the number of bytes of a position of the shape, history aside.
+    """
+    return WIRE.size if shape.fits_64 else 2 * shape.board_bytes + 1
+
+
+class GameState:
+    def __init__(self, shape=STANDARD):
+        """
+        The position of a game: the bitboards of both players (BasePlayer
+        layout, BITBOARDS[0] belongs to player 1), the height of every column
+        and whose turn it is. Playing a move and checking for a win are O(1);
+        the numpy board some players want is only built when asked for.
+        shape is the BoardShape of the board.
+        """
+        self.shape = shape
+        self.BITBOARDS = [0, 0]
+        self.heights = [0] * shape.width
+        self.current_turn = 0
+        self.moves = []  # the columns played so far
+        self._board = None  # cached numpy view, see board
+
+    def can_play(self, col):
+        return 0 <= col < self.shape.width and self.heights[col] < self.shape.height
+
+    def play(self, col):
+        """
+        Drops a token of the player to move in col, switches the turn and
+        returns the row it landed in (0 is the bottom).
+        """
+        row = self.heights[col]
+        self.BITBOARDS[self.current_turn] |= self.shape.bottom_bits[col] << row
+        self.heights[col] += 1
+        self.moves.append(col)
+        if self._board is not None:
+            self._board[self.shape.height - 1 - row, col] = self.current_turn + 1
+        self.current_turn = int(not self.current_turn)
+        return row
+
+    def has_won(self, p):
+        """
+        Returns whether player p (0 or 1) has four (connect) in a row. Only
+        the player who just moved can have a new one, so that is all a
+        referee checks.
+        """
+        return self.shape.has_won(self.BITBOARDS[p])
+
+    def last_move_won(self):
+        return bool(self.BITBOARDS[int(not self.current_turn)]) \
+            and self.has_won(int(not self.current_turn))
+
+    def is_full(self):
+        return sum(self.heights) == self.shape.cells
+
+    def to_wire(self, history=False):
+        """
+        Returns the position as WIRE bytes, 17 of them, plus one per move
+        played with history. This is what crosses process boundaries instead
+        of a pickled board or Game. The shape is not sent, both ends have to
+        agree on it.
+        """
+        board1, board2 = self.BITBOARDS
+        if self.shape.fits_64:
+            data = WIRE.pack(board1, board2, self.current_turn)
+        else:
+            size = self.shape.board_bytes
+            data = (board1.to_bytes(size, 'little') + board2.to_bytes(size, 'little')
+                    + bytes((self.current_turn,)))
+        if history:
+            data += bytes(self.moves)
+        return data
+
+    @staticmethod
+    def from_wire(data, shape=STANDARD):
+        """
+        Returns the GameState of WIRE bytes of a board of the shape. moves
+        is only known if the history was sent (it is replayed and checked
+        then), otherwise it is empty. Raises ValueError if the bytes are not
+        a valid position.
+        """
+        size = wire_size(shape)
+        if len(data) < size:
+            raise ValueError('A position takes at least {} bytes'.format(size))
+        if shape.fits_64:
+            board1, board2, current_turn = WIRE.unpack_from(data)
+        else:
+            n = shape.board_bytes
+            board1 = int.from_bytes(data[:n], 'little')
+            board2 = int.from_bytes(data[n:2 * n], 'little')
+            current_turn = data[2 * n]
+        history = data[size:]
+        if history:
+            state = GameState(shape)
+            for col in history:
+                if not state.can_play(col):
+                    raise ValueError('Illegal move {} in the history'.format(col))
+                state.play(col)
+            if state.BITBOARDS != [board1, board2] or \
+                    state.current_turn != current_turn:
+                raise ValueError('The history does not lead to the position')
+            return state
+        if (board1 | board2) & ~shape.board_mask or board1 & board2 \
+                or current_turn not in (0, 1):
+            raise ValueError('Not a position')
+        state = GameState(shape)
+        state.BITBOARDS = [board1, board2]
+        state.current_turn = current_turn
+        mask = board1 | board2
+        for col in range(shape.width):
+            column = (mask & shape.column_masks[col]) >> (col * shape.column_bits)
+            state.heights[col] = column.bit_length()
+            if column & (column + 1):  # a token above an empty cell
+                raise ValueError('Not a position')
+        return state
+
+    @property
+    def board(self):
+        """
+        The height x width numpy board (row 0 is the top, 1 and 2 for the
+        players), built on first use and kept up to date by play afterwards.
+        """
+        if self._board is None:
+            self._board = to_array(self.BITBOARDS, self.shape)
+        return self._board
+
+
+def to_array(bitboards, shape=STANDARD):
+    """
+    Builds the numpy board used by Player.AIPlayer (row 0 is the top,
+    player 1 is 1 and player 2 is 2) from the two bitboards.
+    """
+    import numpy as np  # only the players using numpy boards need it
+
+    board = np.zeros([shape.height, shape.width]).astype(np.uint8)
+    for p, bitboard in enumerate(bitboards):
+        for col in range(shape.width):
+            for row in range(shape.height):
+                if (bitboard >> shape.bit(col, row)) & 1:
+                    board[shape.height - 1 - row, col] = p + 1
+    return board
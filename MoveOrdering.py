@@ -0,0 +1,96 @@
+from BoardShape import STANDARD
+
+MAX_PLY = 64
+
+
+class MoveOrderer:
+    def __init__(self, center=True, killers=True, history=True, hash_move=True,
+                 shape=STANDARD):
+        """
+        Orders the columns searched at a node so that alpha-beta finds its
+        cutoffs early. Every heuristic can be switched off on its own:
+            hash_move: the best column stored for the position (from the
+                transposition table or the previous iteration) goes first
+            killers: the last two columns that caused a cutoff at the same
+                ply come next
+            history: then the columns that caused the most (and deepest)
+                cutoffs for the player to move so far
+            center: ties are broken center-out (3, 2, 4, 1, 5, 0, 6 on the
+                standard board, see BoardShape.center_order) instead of left
+                to right
+
+        cutoffs counts the nodes that were cut off, first_move_cutoffs the
+        ones where the first column searched caused the cutoff.
+        """
+        self.use_center = center
+        self.use_killers = killers
+        self.use_history = history
+        self.use_hash_move = hash_move
+        self.width = shape.width
+        self.static_rank = [0] * shape.width
+        for rank, col in enumerate(shape.center_order if center else range(shape.width)):
+            self.static_rank[col] = rank
+        self.killers = [[-1, -1] for _ in range(MAX_PLY)]
+        self.history = [[0] * shape.width, [0] * shape.width]  # [side][col]
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """
+        Forget the killers (the plies belong to another root now) and age the
+        history so that recent cutoffs weigh more.
+        """
+        self.killers = [[-1, -1] for _ in range(MAX_PLY)]
+        for side in self.history:
+            for col in range(self.width):
+                side[col] >>= 1
+
+    def order(self, cols, ply, hash_col=-1):
+        """
+        Returns the columns sorted from the most to the least promising for
+        the node at the given ply (distance from the root).
+        """
+        if not self.use_hash_move:
+            hash_col = -1
+        killers = self.killers[ply] if self.use_killers and ply < MAX_PLY \
+            else (-1, -1)
+        history = self.history[ply % 2]
+        use_history = self.use_history
+        static_rank = self.static_rank
+
+        def rank(col):
+            if col == hash_col:
+                return 0, 0, 0
+            if col == killers[0]:
+                return 1, 0, 0
+            if col == killers[1]:
+                return 2, 0, 0
+            # more history first, the center rank only breaks ties
+            return 3, (-history[col] if use_history else 0), static_rank[col]
+
+        return sorted(cols, key=rank)
+
+    def cutoff(self, col, ply, index, depth):
+        """
+        Records that col caused a cutoff at the given ply, index is its
+        position in the searched order and depth the remaining depth.
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if self.use_killers and ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != col:
+                killers[1] = killers[0]
+                killers[0] = col
+        if self.use_history:
+            self.history[ply % 2][col] += depth * depth
+
+    def first_move_cutoff_rate(self):
+        """
+        Returns the share of cutoffs produced by the first column searched,
+        the closer to 1 the better the ordering.
+        """
+        if not self.cutoffs:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
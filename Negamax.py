@@ -0,0 +1,186 @@
+from Symmetry import is_symmetric
+from TranspositionTable import EXACT, LOWER, UPPER
+
+WIN_SCORE = 9999999  # same reward as a won board in AI.evalCost
+
+
+class Negamax:
+    def __init__(self, ai, deadline=None, orderer=None, tt=None, pvs=False,
+                 bound=None):
+        """
+        A negamax search over the two bitboards. Unlike Tree.Graph it does not
+        build any nodes: every position only exists as two integers on the
+        call stack, and the search gives back the best column and its score.
+        It is not a drop-in for the tree's values though, see AI.search.
+
+        ai is the PlayerBitBoard.AI whose evalCost, has_won and shape are
+        used.
+        deadline is an optional SearchControl.Deadline.
+        orderer is an optional MoveOrdering.MoveOrderer, without one the
+        columns are searched from left to right.
+        tt is an optional TranspositionTable. The values depend on who the
+        root player is, so a table must only be shared by searches for the
+        same player.
+        With pvs (principal variation search) only the first move of every
+        position gets the full window, the others are searched with a null
+        window around alpha and only searched again if they beat it.
+        bound is the ParallelSearch.SharedBound of a root move searched in a
+        pool process: every position narrows its window to the best root
+        value the other moves have reached so far.
+
+        The score is from the point of view of the player to move at the
+        root: leaves are scored with evalCost for the root player, and
+        negated when it is the opponent's turn (sign is 1 or -1). Positions
+        where someone has four in a row are not searched any further.
+        """
+        self.ai = ai
+        self.shape = ai.shape
+        self.deadline = deadline
+        self.orderer = orderer
+        self.tt = tt
+        self.pvs = pvs
+        self.bound = bound
+        self.root_depth = 0
+        self.nodes = 0  # number of positions searched
+        # what the search did, see SearchStats
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hits = 0  # positions found in the transposition table
+
+    def search(self, b, my_board, opp_board, depth, first_col=-1,
+               alpha=-float('inf'), beta=float('inf')):
+        """
+        Returns (column, score) of the best move for the player owning
+        my_board, searching depth plies. first_col is searched first.
+        A score outside (alpha, beta) is only a bound, see
+        SearchControl.windowed_search.
+        """
+        shape = self.shape
+        mask = my_board | opp_board
+        best_col, best_value = -1, -float('inf')
+        self.root_depth = depth
+        columns = range(shape.width)
+        if self.orderer is not None:
+            order = self.orderer.order(columns, 0, first_col)
+        else:
+            order = sorted(columns, key=lambda c: c != first_col)
+        if is_symmetric(my_board, opp_board, shape):  # mirrored moves tie
+            order = [col for col in order if col <= (shape.width - 1) // 2]
+        for col in order:
+            move = (mask + shape.bottom_bits[col]) & shape.column_masks[col]
+            if not move:  # the column is full
+                continue
+            child = my_board | move
+            if self.ai.has_won(child):
+                value = WIN_SCORE + depth
+            else:
+                value = self.search_child(b, opp_board, child, depth - 1,
+                                          alpha, beta, -1, best_col < 0)
+            if value > best_value:
+                best_col, best_value = col, value
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return best_col, best_value
+
+    def search_child(self, b, my_board, opp_board, depth, alpha, beta, sign,
+                     first):
+        """
+        Returns the value of a move for the player who made it, the child
+        position being searched with the full window if it is the first
+        move (or without pvs), with a null window otherwise.
+        """
+        if first or not self.pvs:
+            return -self.negamax(b, my_board, opp_board, depth, -beta, -alpha,
+                                 sign)
+        value = -self.negamax(b, my_board, opp_board, depth, -alpha - 1,
+                              -alpha, sign)
+        if alpha < value < beta:  # better than the first move, get its value
+            value = -self.negamax(b, my_board, opp_board, depth, -beta,
+                                  -alpha, sign)
+        return value
+
+    def negamax(self, b, my_board, opp_board, depth, alpha, beta, sign):
+        """
+        Returns the value of the position for the player to move, who owns
+        my_board. Quicker wins score higher than slower ones.
+        """
+        self.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        if depth == 0:
+            self.leaves += 1
+            if sign > 0:
+                return self.ai.evalCost(b, opp_board, my_board, True)
+            return -self.ai.evalCost(b, my_board, opp_board, False)
+        if self.bound is not None:  # a lower bound for the root player
+            lower = self.bound.lower()
+            if sign > 0:
+                alpha = max(alpha, lower)
+            else:
+                beta = min(beta, -lower)
+            if alpha >= beta:
+                return alpha if sign > 0 else beta
+
+        alpha_orig, beta_orig = alpha, beta
+        key, hash_col = None, -1
+        if self.tt is not None:
+            key = self.tt.key(my_board, opp_board)
+            entry = self.tt.probe(key)
+            if entry is not None:
+                self.hits += 1
+                hash_col = entry[4]
+                if entry[1] >= depth:
+                    flag, value = entry[2], entry[3]
+                    if flag == EXACT:
+                        return value
+                    elif flag == LOWER:
+                        alpha = max(alpha, value)
+                    else:
+                        beta = min(beta, value)
+                    if alpha >= beta:
+                        return value
+
+        mask = my_board | opp_board
+        best_value, best_col = -float('inf'), -1
+        ply = self.root_depth - depth
+        columns = range(self.shape.width)
+        if self.orderer is not None:
+            order = self.orderer.order(columns, ply, hash_col)
+        else:
+            order = sorted(columns, key=lambda c: c != hash_col)
+        bottom_bits, column_masks = self.shape.bottom_bits, self.shape.column_masks
+        index = 0
+        for col in order:
+            move = (mask + bottom_bits[col]) & column_masks[col]
+            if not move:
+                continue
+            child = my_board | move
+            if self.ai.has_won(child):
+                return WIN_SCORE + depth  # nothing beats winning right now
+            value = self.search_child(b, opp_board, child, depth - 1, alpha,
+                                      beta, -sign, index == 0)
+            if value > best_value:
+                best_value, best_col = value, col
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if index == 0:
+                            self.first_move_cutoffs += 1
+                        if self.orderer is not None:
+                            self.orderer.cutoff(col, ply, index, depth)
+                        break
+            index += 1
+        if best_value == -float('inf'):  # the board is full, it's a draw
+            return 0
+        if key is not None:
+            if best_value <= alpha_orig:
+                flag = UPPER
+            elif best_value >= beta_orig:
+                flag = LOWER
+            else:
+                flag = EXACT
+            self.tt.store(key, depth, flag, best_value, best_col)
+        return best_value
@@ -0,0 +1,162 @@
+# system libs
+import mmap
+import os
+import struct
+
+# Local libs
+from BasePlayer import BOTTOM_BITS, COLUMN_MASKS
+from BoardShape import STANDARD
+from Negamax import Negamax
+from Symmetry import canonical, mirror_col
+from TranspositionTable import TranspositionTable
+
+# one entry: position key, best column, score (little endian, no padding)
+RECORD = struct.Struct('<Qbi')
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'opening_book.bin')
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        A read-only opening book: the best column and its score for every
+        position of the first plies, worked out once by a deep search (see
+        build_book) instead of at the start of every game.
+
+        The file is a sorted array of RECORD entries keyed by the canonical
+        TranspositionTable.key of the position (from the side to move), so a
+        position and its mirror image share one entry. It is memory mapped
+        and binary searched, so opening a book costs the same whatever its
+        size and only the pages a lookup touches are read.
+        """
+        self.path = path
+        self.count = os.path.getsize(path) // RECORD.size
+        self.data = None
+        if self.count:  # an empty file cannot be mapped
+            with open(path, 'rb') as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def lookup(self, my_board, opp_board):
+        """
+        Returns (column, score) of the position where the player owning
+        my_board is to move, or None if it is not in the book.
+        Running time: O(log n)
+        """
+        key, mirrored = canonical(TranspositionTable.key(my_board, opp_board))
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, col, score = RECORD.unpack_from(self.data, mid * RECORD.size)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return (mirror_col(col) if mirrored else col), score
+        return None
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        # the map cannot be pickled, a worker process maps the file again
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+def open_book(path=DEFAULT_PATH):
+    """
+    Returns the OpeningBook at path, or None if there is no such file (the
+    engines then search every move).
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def book_positions(plies):
+    """
+    Returns the (my board, opp board) pairs, from the side to move, of every
+    position reachable in fewer than plies moves where nobody has won yet.
+    Positions reached through several move orders, or mirror images of each
+    other, are only listed once.
+    """
+    level = {TranspositionTable.key(0, 0): (0, 0)}
+    positions = []
+    for _ in range(plies):
+        positions.extend(level.values())
+        next_level = {}
+        for (my_board, opp_board) in level.values():
+            mask = my_board | opp_board
+            for col in range(7):
+                move = (mask + BOTTOM_BITS[col]) & COLUMN_MASKS[col]
+                if move and not STANDARD.has_won(my_board | move):
+                    child = (opp_board, my_board | move)  # the other side moves
+                    key, _ = canonical(TranspositionTable.key(*child))
+                    next_level[key] = child
+        level = next_level
+    return positions
+
+
+def analyse(job):
+    """
+    Searches one position depth plies deep with the negamax engine and
+    returns its book entry (canonical key, column, score).
+    """
+    my_board, opp_board, depth = job
+    from PlayerBitBoard import AI  # PlayerBitBoard imports this module
+
+    ai = AI(1, tt_mb=0, search_mode='negamax', book_path=None)
+    col, score = Negamax(ai, orderer=ai.orderer).search(
+        None, my_board, opp_board, depth)
+    key, mirrored = canonical(TranspositionTable.key(my_board, opp_board))
+    return key, (mirror_col(col) if mirrored else col), score
+
+
+def write_book(entries, path):
+    """
+    Writes the (key, column, score) entries sorted by key.
+    """
+    with open(path, 'wb') as f:
+        for entry in sorted(entries):
+            f.write(RECORD.pack(*entry))
+
+
+def build_book(plies, depth, path=DEFAULT_PATH, processes=None):
+    """
+    Searches every position of the first plies moves and writes the book,
+    spreading the searches over a pool of processes (one per core by
+    default).
+    """
+    import multiprocessing as mp  # the engines only read the book
+
+    jobs = [(my, opp, depth) for (my, opp) in book_positions(plies)]
+    with mp.Pool(processes or mp.cpu_count()) as pool:
+        entries = pool.map(analyse, jobs, chunksize=1)
+    write_book(entries, path)
+    return len(entries)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plies', type=int, default=4,
+                        help='Cover the positions of the first plies moves (int)')
+    parser.add_argument('--depth', type=int, default=10,
+                        help='Depth of the negamax search of each position (int)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Size of the process pool (default: one per core)')
+    parser.add_argument('--out', default=DEFAULT_PATH,
+                        help='File to write the book to')
+    args = parser.parse_args()
+
+    count = build_book(args.plies, args.depth, args.out, args.processes)
+    print('{} positions written to {}'.format(count, args.out))
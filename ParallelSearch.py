@@ -0,0 +1,193 @@
+import os
+
+from BoardShape import STANDARD
+from SearchControl import Deadline, SearchTimeout
+from SearchStats import SearchStats
+
+infinity = float('inf')
+
+# set in every pool process by init_worker
+shared_alpha = None  # best exact root value found so far in this search
+engines = {}  # the engine of each kind, kept for the life of the process
+
+
+def init_worker(alpha):
+    global shared_alpha
+    shared_alpha = alpha
+
+
+class SharedBound:
+    def __init__(self, alpha, every=256):
+        """
+        The lower bound of a root move's search in a pool process: one below
+        the best root value any process has found (see search_move). The
+        searches ask for it at every position, but reading the shared value
+        takes its lock, so it is only read again every every calls, like
+        SearchControl.Interrupt polls. It only goes up during a search.
+        """
+        self.alpha = alpha
+        self.every = every
+        self.count = 0
+        self.value = alpha.value - 1
+
+    def lower(self):
+        self.count += 1
+        if self.count >= self.every:
+            self.count = 0
+            self.value = max(self.value, self.alpha.value - 1)
+        return self.value
+
+
+def worker_engine(kind, player_number, shape):
+    """
+    Returns this process's engine for kind ('negamax' for PlayerBitBoard.AI,
+    'alphabeta' for Player.AIPlayer) on a board of the shape, created on
+    first use. It keeps its move orderer warm from one root move to the next.
+    """
+    if (kind, player_number, shape) not in engines:
+        # imported here, both modules import this one
+        if kind == 'negamax':
+            from PlayerBitBoard import AI
+            engine = AI(player_number, tt_mb=0, search_mode='negamax',
+                        book_path=None, endgame_cells=0, shape=shape)
+        else:
+            from Player import AIPlayer
+            engine = AIPlayer(player_number, book_path=None, endgame_cells=0,
+                              shape=shape)
+        engines[kind, player_number, shape] = engine
+    return engines[kind, player_number, shape]
+
+
+def search_move(job):
+    """
+    Runs in a pool process: searches one root move and returns (index,
+    value, exact, stats), value being from the root player's view and stats
+    the SearchStats counters of the search.
+
+    job is (kind, player_number, index, position, move, depth, end, shape):
+        position is (my board, opp board) after the move for 'negamax' and
+        the (player 1, player 2) node after the move for 'alphabeta'
+        move is the bit of the root move
+        end is the perf_counter time the search must stop at, or None
+        shape is the BoardShape of the board
+
+    The move is searched with the window (alpha - 1, inf), alpha being the
+    best value any root move reached so far. The search keeps polling alpha
+    (see SharedBound), so a better value found by another process while
+    this move is being searched narrows the rest of its search. The values
+    are integers, so a value above alpha - 1 is exact even when it only ties
+    alpha, and the result does not depend on which moves finished first.
+    """
+    kind, player_number, index, position, move, depth, end, shape = job
+    engine = worker_engine(kind, player_number, shape)
+    bound = SharedBound(shared_alpha)
+    deadline = None if end is None else Deadline.until(end)
+    try:
+        if kind == 'negamax':
+            value, stats = search_negamax(engine, position, depth, bound,
+                                          deadline)
+        else:
+            value, stats = search_alphabeta(engine, position, move, depth,
+                                            bound, deadline)
+    except SearchTimeout:
+        return index, None, False, SearchStats()
+    exact = value > bound.value  # the last bound the search used
+    if exact:
+        with shared_alpha.get_lock():
+            if value > shared_alpha.value:
+                shared_alpha.value = value
+    return index, value, exact, stats
+
+
+def search_negamax(ai, position, depth, bound, deadline):
+    from Negamax import Negamax, WIN_SCORE
+
+    opp_board, child = position  # the opponent is to move
+    stats = SearchStats()
+    if ai.has_won(child):
+        return WIN_SCORE + depth, stats
+    negamax = Negamax(ai, deadline, ai.orderer, bound=bound)
+    negamax.root_depth = depth
+    value = -negamax.negamax(None, opp_board, child, depth - 1, -infinity,
+                             -bound.value, -1)
+    stats.add(negamax)
+    return value, stats
+
+
+def search_alphabeta(player, node, move, depth, bound, deadline):
+    player.stats = SearchStats()
+    player.deadline = deadline
+    player.bound = bound
+    try:
+        value = player.alphabeta(node, depth - 1, depth, bound.value, infinity,
+                                 player.switch_player(player.player_number),
+                                 move)
+    finally:
+        player.deadline = None
+        player.bound = None
+    return value, player.stats
+
+
+class RootSplitter:
+    def __init__(self, processes=None):
+        """
+        Searches the root moves of a position in parallel, one per process of
+        a pool (one per core by default). The moves are handed out in the
+        order given, so the likely best ones start first and the others get
+        the best value found so far as their alpha bound, which the moves
+        being searched keep polling (see SharedBound).
+
+        For a fixed depth the result is the same as a sequential search:
+        every move that can tie or beat the best gets an exact value (see
+        search_move), and ties go to the move that comes first.
+        """
+        self.processes = processes or os.cpu_count()
+        self.alpha = None
+        self.pool = None
+        self.stats = SearchStats()  # what the pool did in the last search
+
+    def start(self):
+        # only imported once a pool is needed, most engines never start one
+        import multiprocessing as mp
+
+        self.alpha = mp.Value('d', -infinity)
+        self.pool = mp.Pool(self.processes, init_worker, (self.alpha,))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def search(self, kind, player_number, moves, depth, deadline=None,
+               shape=STANDARD):
+        """
+        Returns (column, value) of the best of moves, a list of (column,
+        position, move) in the order to search them (see search_move), on a
+        board of the shape. Raises SearchTimeout if the deadline passed
+        before every move was searched.
+        """
+        if self.pool is None:
+            self.start()
+        self.alpha.value = -infinity
+        end = None if deadline is None else deadline.end
+        jobs = [(kind, player_number, index, position, move, depth, end, shape)
+                for (index, (col, position, move)) in enumerate(moves)]
+        results = self.pool.map(search_move, jobs, chunksize=1)
+        self.stats = SearchStats()
+        for (_, _, _, stats) in results:
+            self.stats.add(stats)
+        if any(value is None for (_, value, _, _) in results):
+            raise SearchTimeout()
+        best_index, best_value = 0, -infinity
+        for (index, value, exact, _) in results:  # in order, ties go first
+            if exact and value > best_value:
+                best_index, best_value = index, value
+        return moves[best_index][0], best_value
+
+    def __getstate__(self):
+        # a pool can't be pickled, the copy starts its own when it searches
+        return self.processes
+
+    def __setstate__(self, processes):
+        self.__init__(processes)
@@ -1,31 +1,158 @@
 import math
 import sys
-
-import numpy as np
-
-# (starting coordinate, direction)
-N = ([(5, 0), (5, 1), (5, 2), (5, 3), (5, 4), (5, 5), (5, 6)], (-1, 0))
-E = ([(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (5, 0)], (0, 1))
-NE = ([(3, 0), (4, 0), (5, 0), (5, 1), (5, 2), (5, 3)], (-1, 1))
-SE = ([(5, 3), (5, 4), (5, 5), (5, 6), (4, 6), (3, 6)], (-1, -1))
-
-scores = [[3, 4, 5, 7, 5, 4, 3],
-          [4, 6, 8, 10, 8, 6, 4],
-          [5, 8, 11, 13, 11, 8, 5],
-          [5, 8, 11, 13, 11, 8, 5],
-          [4, 6, 8, 10, 8, 6, 4],
-          [3, 4, 5, 7, 5, 4, 3]]
+from time import perf_counter
+
+from BasePlayer import BasePlayer, popcount
+from BoardShape import STANDARD
+from Expectimax import Expectimax
+from GameState import GameState
+from MoveOrdering import MoveOrderer
+from OpeningBook import DEFAULT_PATH, open_book
+from ParallelSearch import RootSplitter
+from SearchControl import Deadline, SearchTimeout, search_budget, windowed_search
+from SearchStats import SearchStats
+from Solver import ENDGAME_CELLS, Solver
+from TranspositionTable import TranspositionTable
 
 infinity = float('inf')
 
 
-class AIPlayer:
-
-    def __init__(self, player_number):
+def line_length(shape, x, y, d1, d2):
+    length = 0
+    while 0 <= x < shape.height and 0 <= y < shape.width:
+        length += 1
+        x += d1
+        y += d2
+    return length
+
+
+def line_starts(shape):
+    """
+    Returns the (starting coordinates, direction) of the lines of the board,
+    coordinates being (row, column) with row 0 at the top: N the columns, E
+    the rows, NE and SE the diagonals. The lines too short to hold shape.connect
+    in a row are left out. On the standard board:
+        N = ([(5, 0), (5, 1), (5, 2), (5, 3), (5, 4), (5, 5), (5, 6)], (-1, 0))
+        E = ([(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (5, 0)], (0, 1))
+        NE = ([(3, 0), (4, 0), (5, 0), (5, 1), (5, 2), (5, 3)], (-1, 1))
+        SE = ([(5, 3), (5, 4), (5, 5), (5, 6), (4, 6), (3, 6)], (-1, -1))
+    """
+    bottom = [(shape.height - 1, y) for y in range(shape.width)]
+    left = [(x, 0) for x in range(shape.height)]
+    right = [(x, shape.width - 1) for x in range(shape.height - 2, -1, -1)]
+    lines = [(bottom, (-1, 0)), (left, (0, 1)), (left + bottom[1:], (-1, 1)),
+             (bottom + right, (-1, -1))]
+    return [([(x, y) for (x, y) in starts
+              if line_length(shape, x, y, d1, d2) >= shape.connect], (d1, d2))
+            for (starts, (d1, d2)) in lines]
+
+
+def square_scores(shape):
+    """
+    Returns how many lines of shape.connect cells go through each cell, by
+    row (0 is the top) and column. On the standard board:
+        [[3, 4, 5, 7, 5, 4, 3],
+         [4, 6, 8, 10, 8, 6, 4],
+         [5, 8, 11, 13, 11, 8, 5],
+         [5, 8, 11, 13, 11, 8, 5],
+         [4, 6, 8, 10, 8, 6, 4],
+         [3, 4, 5, 7, 5, 4, 3]]
+    """
+    scores = [[0] * shape.width for _ in range(shape.height)]
+    connect = shape.connect
+    for (starts, (d1, d2)) in line_starts(shape):
+        for (x, y) in starts:
+            length = line_length(shape, x, y, d1, d2)
+            for i in range(length):
+                # the windows of the line through its i-th cell
+                windows = min(i, length - connect) - max(0, i - connect + 1) + 1
+                scores[x + i * d1][y + i * d2] += windows
+    return scores
+
+
+def cell_bit_table(shape):
+    """
+    Returns the bit of row x (0 is the top) and column y in the BasePlayer
+    layout, as table[x][y].
+    """
+    return [[shape.bit(y, shape.height - 1 - x) for y in range(shape.width)]
+            for x in range(shape.height)]
+
+
+cell_bits = cell_bit_table(STANDARD)
+
+
+class AIPlayer(BasePlayer):
+
+    def __init__(self, player_number, time_limit=None, move_ordering=True,
+                 book_path=DEFAULT_PATH, endgame_cells=ENDGAME_CELLS,
+                 processes=1, pvs=False, driver='alphabeta', stats_path=None,
+                 pondering=False, shape=STANDARD):
+        """
+        The searches run on (player 1 bitboard, player 2 bitboard) tuples laid
+        out like in BasePlayer. The numpy board handed to get_alpha_beta_move
+        and get_expectimax_move is converted once, at the root. shape is the
+        BoardShape played on, the lines, windows and scores follow from it.
+        """
         self.player_number = player_number
         self.type = 'ai'
         self.player_string = 'Player {}:ai'.format(player_number)
-        self.lines = self.create_lines(self)
+        self.shape = shape
+        if shape != STANDARD:
+            self.has_won = shape.has_won
+        self.cell_bits = cell_bit_table(shape)
+        self.scores = square_scores(shape)
+        self.lines = self.create_lines()
+        self.cell_lines = self.create_cell_lines(self.lines)
+        self.windows = self.create_windows(self.lines)
+        # turn limit in seconds, when set the searches deepen iteratively
+        # instead of using a fixed depth
+        self.time_limit = time_limit
+        self.deadline = None
+        # the ParallelSearch.SharedBound of a root move searched in a pool
+        # process, None otherwise
+        self.bound = None
+        # killers/history/center-first ordering for alphabeta, None searches
+        # the columns from left to right
+        self.orderer = MoveOrderer(shape=shape) if move_ordering else None
+        # what the search of the last move did, appended to stats_path as a
+        # JSON line per move if it is set
+        self.stats = SearchStats()
+        self.stats_path = stats_path
+        # expectimax values of the positions searched for the current move
+        self.expectimax_memo = {}
+        # precomputed moves of the first plies, None if there is no book (the
+        # book is for the standard board)
+        self.book = open_book(book_path) if shape == STANDARD else None
+        # with this many empty cells or fewer the position is solved exactly
+        # (0 never solves), the solver's table is kept between moves
+        self.endgame_cells = endgame_cells
+        self.solver_tt = TranspositionTable(shape=shape) if endgame_cells else None
+        # with more than one process the root moves of alpha_beta_search are
+        # searched in parallel
+        self.splitter = RootSplitter(processes) if processes > 1 else None
+        # principal variation search in alphabeta, and how the root of
+        # alpha_beta_search is searched: 'alphabeta', 'aspiration' (around the
+        # last depth's value) or 'mtdf', see SearchControl.windowed_search.
+        # There is no transposition table, so MTD(f) searches everything again
+        # on each pass
+        self.pvs = pvs
+        self.driver = driver
+        self.value = None  # value of the last finished depth of this move
+        # with pondering an AIWorker keeps searching on the opponent's time,
+        # see ponder; pondered maps the positions it searched to the (depth,
+        # column) it got to, ponder_stats is what it did
+        self.pondering = pondering
+        self.pondered = {}
+        self.ponder_stats = SearchStats()
+        BasePlayer.__init__(self, "CPU", True)
+
+    @property
+    def nodes(self):
+        """
+        Positions visited by the last search.
+        """
+        return self.stats.nodes
 
     @staticmethod
     def switch_player(player):
@@ -34,59 +161,113 @@ class AIPlayer:
         else:
             return 1
 
-    @staticmethod
-    def generate_moves(board, player):
-        boards = []
-        transposed_board = list(map(list, zip(*board)))
-        for c1, col in enumerate(transposed_board):
-            temp_board = transposed_board[:]
-            try:
-                pos = next(i for i, v in zip(range(len(col) - 1, -1, -1), reversed(col)) if v == 0)
-                new_col = col[:]
-                new_col[pos] = player
-                temp_board[c1] = new_col
-                boards.append(list(map(list, zip(*temp_board))))
-            except StopIteration:
-                continue
-        return np.array(boards)
+    def to_bitboards(self, board):
+        """
+        Converts a numpy board (row 0 is the top) into the bitboards of
+        player 1 and player 2. A position in wire format (see
+        GameState.to_wire) or anything with BITBOARDS (a GameState or Game) is
+        taken too, then numpy is not needed at all.
+        """
+        if isinstance(board, (bytes, bytearray)):
+            return tuple(GameState.from_wire(board, self.shape).BITBOARDS)
+        if hasattr(board, 'BITBOARDS'):
+            return tuple(board.BITBOARDS)
+        bitboards = [0, 0]
+        for x in range(self.shape.height):
+            for y in range(self.shape.width):
+                if board[x][y]:
+                    bitboards[int(board[x][y]) - 1] |= 1 << self.cell_bits[x][y]
+        return tuple(bitboards)
+
+    def generate_moves(self, node, player):
+        """
+        Returns a (column, child, move) triple for every column that is not
+        full, from left to right, where child is the node after player's move
+        and move is the bit of the token that was dropped.
+        """
+        children = []
+        mask = node[0] | node[1]
+        bottom_bits, column_masks = self.shape.bottom_bits, self.shape.column_masks
+        for col in range(self.shape.width):
+            move = (mask + bottom_bits[col]) & column_masks[col]
+            if move:
+                if player == 1:
+                    children.append((col, (node[0] | move, node[1]), move))
+                else:
+                    children.append((col, (node[0], node[1] | move), move))
+        return children
 
-    @staticmethod
     def create_lines(self):
         lines = []
-        for x in N[0]:
-            lines.append(((self.create_line(x[0], x[1], N[1][0], N[1][1])), (N[1][0], N[1][1])))
-        for x in E[0]:
-            lines.append(((self.create_line(x[0], x[1], E[1][0], E[1][1])), (E[1][0], E[1][1])))
-        for x in NE[0]:
-            lines.append(((self.create_line(x[0], x[1], NE[1][0], NE[1][1])), (NE[1][0], NE[1][1])))
-        for x in SE[0]:
-            lines.append(((self.create_line(x[0], x[1], SE[1][0], SE[1][1])), (SE[1][0], SE[1][1])))
+        for (starts, (d1, d2)) in line_starts(self.shape):
+            for (x, y) in starts:
+                lines.append((self.create_line(x, y, d1, d2), (d1, d2)))
         return lines
 
-    @staticmethod
-    def create_line(x, y, d1, d2):
+    def create_cell_lines(self, lines):
+        """
+        Builds the index from every cell (as its bit) to the lines going
+        through it. Each line is stored as (bitmask of its cells, shifts),
+        the shifts check_last_move finds connect in a row with: multiples of
+        the distance in bits between two neighbouring cells of the line (1
+        vertical, 7 horizontal, 8 and 6 for the diagonals on the standard
+        board).
+        """
+        cell_lines = {}
+        cell_bits = self.cell_bits
+        for (line, (d1, d2)) in lines:
+            line_mask = 0
+            for (x, y) in line:
+                line_mask |= 1 << cell_bits[x][y]
+            shift = abs(d2 * self.shape.column_bits - d1)
+            shifts = tuple(step * shift for step in self.shape.win_steps)
+            for (x, y) in line:
+                cell_lines.setdefault(1 << cell_bits[x][y], []).append((line_mask, shifts))
+        return cell_lines
+
+    def create_windows(self, lines):
+        """
+        Precomputes the windows of connect cells of the lines (69 of four on
+        the standard board) as tuples of (bitmask, direction, cells, scores).
+        scores maps every way player 1 can own some cells of the window (a
+        bitmask) to what score_partial_line gives it, assuming the column
+        below each token is filled like in a real game. score_board only has
+        to look them up.
+        """
+        windows = []
+        connect, cell_bits = self.shape.connect, self.cell_bits
+        for (line, direction) in lines:
+            for start in range(0, len(line) - connect + 1):
+                cells = line[start:start + connect]
+                bits = [1 << cell_bits[x][y] for (x, y) in cells]
+                window = sum(bits)
+                scores = {}
+                for subset in range(1, 1 << connect):
+                    mine = sum(bit for (i, bit) in enumerate(bits) if subset >> i & 1)
+                    below = 0  # the tokens under the window's tokens
+                    for (x, y) in cells:
+                        if (mine >> cell_bits[x][y]) & 1:
+                            for row in range(x + 1, self.shape.height):
+                                below |= 1 << cell_bits[row][y]
+                    scores[mine] = self.score_partial_line(cells, direction, (mine, below & ~window), 1)
+                windows.append((window, direction, cells, scores))
+        return windows
+
+    def create_line(self, x, y, d1, d2):
         line = []
-        while 0 <= x <= 5 and 0 <= y <= 6:
+        while 0 <= x < self.shape.height and 0 <= y < self.shape.width:
             line.append((x, y))
             x += d1
             y += d2
         return line
 
-    @staticmethod
-    def check_empty(line, board):
-        for pos in line:
-            if board[pos[0]][pos[1]] != 0:
+    def check_empty(self, line, node):
+        mask = node[0] | node[1]
+        for (x, y) in line:
+            if (mask >> self.cell_bits[x][y]) & 1:
                 return False
         return True
 
-    @staticmethod
-    def get_move(current_board, best_board):
-        transposed_current_board = list(map(list, zip(*current_board)))
-        transposed_best_board = list(map(list, zip(*best_board)))
-        for (count, col) in enumerate(transposed_current_board):
-            if not np.array_equal(col, transposed_best_board[count]):
-                return count
-
     def get_alpha_beta_move(self, board):
 
         # b1 = [[0, 0, 0, 0, 0, 0, 0],
@@ -117,174 +298,470 @@ class AIPlayer:
         #                   [1, 0, 1, 1, 1, 0, 2],
         #                   [2, 0, 2, 1, 1, 0, 2]])
 
-        depth = 4
-        alpha, beta, best_value = -infinity, infinity, -infinity
-        turns = self.generate_moves(board, self.player_number)
-        best_turn = turns[0]
-        winning_moves = self.get_winning_moves(board)
+        node = self.to_bitboards(board)
+        self.stats = SearchStats()
+        book_col = self.book_move(node)
+        if book_col >= 0:
+            return self.stats.finish(book_col, 'book', self.stats_path)
+        winning_moves = self.get_winning_moves(node)
         if len(winning_moves) > 0:
-            return self.get_move(board, winning_moves[0])
-        for (count, node) in enumerate(turns):
-            current_value = self.alphabeta(node, depth - 1, depth, alpha, beta, self.switch_player(self.player_number))
+            return self.stats.finish(winning_moves[0], 'win', self.stats_path)
+        deadline = self.new_deadline()
+        solved_col = self.solve(node, deadline)
+        if solved_col >= 0:
+            return self.stats.finish(solved_col, 'solver', self.stats_path)
+        if self.orderer is not None:
+            self.orderer.new_search()
+        self.value = None
+        if self.time_limit is not None:
+            done, best_col = self.pondered.get(node, (0, -1))
+            col = self.iterative_deepening(node, self.alpha_beta_search, deadline,
+                                           done, best_col)
+        else:
+            col = self.alpha_beta_search(node, 4)
+        return self.stats.finish(col, 'search', self.stats_path)
+
+    def alpha_beta_search(self, root, depth, first_col=-1):
+        start, nodes = perf_counter(), self.stats.nodes
+        turns = self.generate_moves(root, self.player_number)
+        if self.splitter is not None:
+            best_col = self.parallel_alpha_beta_search(turns, depth, first_col)
+        else:
+            def root_search(alpha, beta):
+                return self.alpha_beta_root(turns, depth, first_col, alpha, beta)
+            best_col, self.value = windowed_search(root_search, self.driver, self.value)
+        self.stats.iteration(depth, self.stats.nodes - nodes, perf_counter() - start)
+        return best_col
+
+    def alpha_beta_root(self, turns, depth, first_col, alpha, beta):
+        """
+        Returns (column, value) of the best of the root moves turns, searched
+        in the window (alpha, beta). A value outside the window is a bound.
+        """
+        best_value = -infinity
+        best_col = turns[0][0]
+        for (index, (col, node, move)) in enumerate(self.order_turns(turns, first_col)):
+            current_value = self.search_child(node, depth - 1, depth, alpha, beta,
+                                              self.switch_player(self.player_number), move, index == 0)
             if current_value > best_value:
                 best_value = current_value
-                best_turn = node
+                best_col = col
             alpha = max(alpha, best_value)
             if beta <= alpha:
                 break
-        return self.get_move(board, best_turn)
+        return best_col, best_value
+
+    def parallel_alpha_beta_search(self, turns, depth, first_col=-1):
+        """
+        alpha_beta_search with its root moves searched on the splitter's
+        pool, it returns the same column.
+        """
+        try:
+            col, _ = self.splitter.search('alphabeta', self.player_number,
+                                          self.order_turns(turns, first_col),
+                                          depth, self.deadline, self.shape)
+        finally:
+            self.stats.add(self.splitter.stats)
+        return col
+
+    def order_turns(self, turns, first_col, ply=0):
+        """
+        Returns the (column, node, move) triples of turns with the turn that plays
+        first_col moved to the front and the others sorted by the move
+        orderer (if there is one).
+        """
+        if self.orderer is not None:
+            rank = {col: i for i, col in enumerate(self.orderer.order([turn[0] for turn in turns], ply, first_col))}
+            return sorted(turns, key=lambda turn: rank[turn[0]])
+        return sorted(turns, key=lambda turn: turn[0] != first_col)
+
+    def order_children(self, node, player, ply):
+        return self.order_turns(self.generate_moves(node, player), -1, ply)
+
+    def new_deadline(self):
+        """
+        Returns the Deadline of this turn's search, None without time limit.
+        """
+        if self.time_limit is None:
+            return None
+        return Deadline(search_budget(self.time_limit))
+
+    def solve(self, node, deadline=None, wins_only=False):
+        """
+        Returns the column of perfect play once no more than endgame_cells
+        cells are empty, or -1: earlier in the game, if the solver did not
+        finish in half of the time left before the deadline, or, with
+        wins_only, if the position is not won.
+        """
+        if self.shape.cells - popcount(node[0] | node[1]) > self.endgame_cells:
+            return -1
+        if deadline is not None:
+            deadline = Deadline(deadline.remaining() / 2)
+        solver = Solver(self.solver_tt, deadline, self.shape)
+        try:
+            col, score = solver.solve(node[self.player_number - 1],
+                                      node[2 - self.player_number])
+        except SearchTimeout:
+            return -1
+        finally:
+            self.stats.add(solver)
+        if wins_only and score <= 0:
+            return -1
+        return col
+
+    def iterative_deepening(self, root, search, deadline=None, done=0,
+                            best_col=-1):
+        """
+        Runs search(root, depth, first_col) for depth 1, 2, 3... until the
+        time budget (or the deadline) runs out, and returns the move of the
+        last depth that finished. The best move of each depth is searched
+        first in the next. done is a depth searched already (by ponder),
+        best_col being its move.
+        """
+        self.deadline = deadline or self.new_deadline()
+        try:
+            empty_cells = self.shape.cells - bin(root[0] | root[1]).count('1')
+            for depth in range(done + 1, empty_cells + 1):
+                best_col = search(root, depth, best_col)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        if best_col < 0:  # not even depth 1 finished
+            best_col = self.generate_moves(root, self.player_number)[0][0]
+        return best_col
+
+    def book_move(self, node):
+        """
+        Returns the opening book's column for the node, or -1 when there is
+        no book or the position is not in it.
+        """
+        if self.book is None:
+            return -1
+        entry = self.book.lookup(node[self.player_number - 1],
+                                 node[2 - self.player_number])
+        return -1 if entry is None else entry[0]
 
-    def get_winning_moves(self, board):
+    def get_winning_moves(self, node):
         moves = []
-        for turn in self.generate_moves(board, self.player_number):
-            if self.check_win(turn) > 0:
-                moves.append(turn)
-        for turn in self.generate_moves(board, self.switch_player(self.player_number)):
-            if self.check_win(turn) > 0:
-                moves.append(turn)
+        opponent = self.switch_player(self.player_number)
+        for (col, turn, move) in self.generate_moves(node, self.player_number):
+            if self.check_last_move(turn, move, self.player_number) > 0:
+                moves.append(col)
+        for (col, turn, move) in self.generate_moves(node, opponent):
+            if self.check_last_move(turn, move, opponent) > 0:
+                moves.append(col)
         return moves
 
-    def alphabeta(self, node, depth, level, alpha, beta, player):
-        if depth == 0 or self.check_win(node) > 0:
-            return self.evaluation_function(node, level, self.player_number)
+    def search_child(self, node, depth, level, alpha, beta, player, last_move, first):
+        """
+        alphabeta on a child, player being the one to move there. With pvs
+        only the first child gets the full window, the others a null window
+        (they only need to be shown no better) and a second search if they
+        turn out better after all.
+        """
+        if first or not self.pvs:
+            return self.alphabeta(node, depth, level, alpha, beta, player, last_move)
+        if player == self.player_number:  # the child is a max node below a min one
+            value = self.alphabeta(node, depth, level, beta - 1, beta, player, last_move)
+        else:
+            value = self.alphabeta(node, depth, level, alpha, alpha + 1, player, last_move)
+        if alpha < value < beta:
+            value = self.alphabeta(node, depth, level, alpha, beta, player, last_move)
+        return value
+
+    def ponder(self, board, stop):
+        """
+        Searches on the opponent's time, like PlayerBitBoard.AI.ponder. board
+        is the position after our move (a numpy board or wire bytes), stop a
+        SearchControl.Interrupt. alphabeta keeps no table, what carries over
+        to the real reply is pondered (iterative_deepening starts past the
+        depth reached), the move orderer's history and in the endgame the
+        solver's table. With a splitter it does not ponder.
+        """
+        node = self.to_bitboards(board)
+        self.pondered = {}
+        if self.splitter is not None:
+            return
+        me, opp = self.player_number, self.switch_player(self.player_number)
+        # the opponent's replies that don't win on the spot, the ones the
+        # last search's killers and history expect first
+        replies = [child for (col, child, move)
+                   in self.order_turns(self.generate_moves(node, opp), -1, 1)
+                   if not self.check_last_move(child, move, opp)]
+        if self.orderer is not None:
+            self.orderer.new_search()
+        empty_cells = self.shape.cells - popcount(node[0] | node[1]) - 1
+        stats, self.stats = self.stats, SearchStats()
+        self.deadline = stop
+        try:
+            if empty_cells <= self.endgame_cells:
+                for child in replies:
+                    solver = Solver(self.solver_tt, stop, self.shape)
+                    try:
+                        solver.solve(child[me - 1], child[2 - me])
+                    finally:
+                        self.stats.add(solver)
+                return
+            for depth in range(1, empty_cells + 1):
+                for child in replies:
+                    best_col = self.pondered.get(child, (0, -1))[1]
+                    self.value = None
+                    best_col = self.alpha_beta_search(child, depth, best_col)
+                    self.pondered[child] = (depth, best_col)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+            self.ponder_stats, self.stats = self.stats, stats
+
+    def alphabeta(self, node, depth, level, alpha, beta, player, last_move=0):
+        """
+        last_move is the bit of the token the other player just dropped, only
+        the lines through it can hold a new four in a row (0 checks the whole
+        board).
+        """
+        self.stats.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        winner = self.check_last_move(node, last_move, self.switch_player(player))
+        if depth == 0 or winner > 0:
+            self.stats.leaves += 1
+            return self.evaluation_function(node, level, self.player_number, winner)
+        if self.bound is not None:  # the other root moves may have raised alpha
+            alpha = max(alpha, self.bound.lower())
+            if beta <= alpha:
+                return alpha
+        ply = level - depth
         if player == self.player_number:
             best_value = -infinity
-            for child in self.generate_moves(node, player):
+            for (index, (col, child, move)) in enumerate(self.order_children(node, player, ply)):
                 best_value = max(best_value,
-                                 self.alphabeta(child, depth - 1, level, alpha, beta, self.switch_player(player)))
+                                 self.search_child(child, depth - 1, level, alpha, beta, self.switch_player(player),
+                                                   move, index == 0))
                 alpha = max(alpha, best_value)
                 if beta <= alpha:
+                    self.stats.cutoff(index)
+                    if self.orderer is not None:
+                        self.orderer.cutoff(col, ply, index, depth)
                     break
             return best_value
         else:
             best_value = infinity
-            for child in self.generate_moves(node, player):
+            for (index, (col, child, move)) in enumerate(self.order_children(node, player, ply)):
                 best_value = min(best_value,
-                                 self.alphabeta(child, depth - 1, level, alpha, beta, self.switch_player(player)))
+                                 self.search_child(child, depth - 1, level, alpha, beta, self.switch_player(player),
+                                                   move, index == 0))
                 beta = min(beta, best_value)
                 if beta <= alpha:
+                    self.stats.cutoff(index)
+                    if self.orderer is not None:
+                        self.orderer.cutoff(col, ply, index, depth)
                     break
             return best_value
 
     def get_expectimax_move(self, board):
-        depth = 5
-        alpha, beta, best_value = -infinity, infinity, -infinity
-        turns = self.generate_moves(board, self.player_number)
-        best_turn = turns[0]
-        winning_moves = self.get_winning_moves(board)
+        node = self.to_bitboards(board)
+        self.stats = SearchStats()
+        book_col = self.book_move(node)
+        if book_col >= 0:
+            return self.stats.finish(book_col, 'book', self.stats_path)
+        winning_moves = self.get_winning_moves(node)
         if len(winning_moves) > 0:
-            return self.get_move(board, winning_moves[0])
-        for (count, node) in enumerate(turns):
-            current_value = self.expectimax(node, depth - 1, 1, self.switch_player(self.player_number), True, alpha,
-                                            beta)
-            if current_value > best_value:
-                best_value = current_value
-                best_turn = node
-            alpha = max(alpha, best_value)
-            if beta <= alpha:
-                break
-        return self.get_move(board, best_turn)
-
-    def expectimax(self, node, depth, level, player, chance_node, alpha, beta):
-        if depth == 0 or self.check_win(node) > 0:
-            return self.evaluation_function(node, level, self.player_number)
-        elif chance_node:
-            alpha = 0
-            children = self.generate_moves(node, player)
-            for child in children:
-                alpha += ((1 / len(child)) * self.expectimax(child, depth - 1, level + 1, self.switch_player(player),
-                                                             False, alpha, beta))
-            return alpha
+            return self.stats.finish(winning_moves[0], 'win', self.stats_path)
+        # a won endgame is played out perfectly, otherwise the random
+        # opponent's mistakes are worth more than perfect play
+        deadline = self.new_deadline()
+        solved_col = self.solve(node, deadline, wins_only=True)
+        if solved_col >= 0:
+            return self.stats.finish(solved_col, 'solver', self.stats_path)
+        self.expectimax_memo = {}
+        if self.time_limit is not None:
+            col = self.iterative_deepening(node, self.expectimax_search, deadline)
         else:
-            best_value = -infinity
-            for child in self.generate_moves(node, player):
-                best_value = max(best_value,
-                                 self.expectimax(child, depth - 1, level + 1, self.switch_player(player), True, alpha,
-                                                 beta))
-                alpha = max(alpha, best_value)
-                if beta <= alpha:
-                    break
-            return best_value
+            col = self.expectimax_search(node, 5)
+        return self.stats.finish(col, 'search', self.stats_path)
 
-    def evaluation_function(self, board, level, player):
-        if self.check_win(board) == player:
+    def expectimax_search(self, root, depth, first_col=-1):
+        """
+        Returns the column with the best expected value against a random
+        opponent, see Expectimax. The values found are kept in
+        expectimax_memo until the next move.
+        """
+        start = perf_counter()
+        search = Expectimax(self, self.expectimax_memo, self.deadline)
+        try:
+            col, _ = search.search(root, depth, first_col)
+        finally:
+            self.stats.add(search)
+        self.stats.iteration(depth, search.nodes, perf_counter() - start)
+        return col
+
+    def evaluation_function(self, node, level, player, winner=None):
+        if winner is None:
+            winner = self.check_win(node)
+        if winner == player:
             return 10000000
-        elif self.check_win(board) == self.switch_player(player):
+        elif winner == self.switch_player(player):
             return -10000000
-        return self.score_board(board, level, player)  # self.score_board(board, level, self.switch_player(player))
+        return self.score_board(node, level, player)  # self.score_board(node, level, self.switch_player(player))
 
-    def score_board(self, board, level, player):
+    def score_board(self, node, level, player):
+        """
+        Adds up the scores of the windows where player has tokens and the
+        other player has none (the same total as score_line over every line).
+        """
         score = 0
-        for (line, direction) in self.lines:
-            if not self.check_empty(line, board):
-                score += self.score_line(line, direction, board, player)
+        mine, theirs = node[player - 1], node[2 - player]
+        for (window, direction, cells, scores) in self.windows:
+            if not theirs & window:
+                owned = mine & window
+                if owned:
+                    score += scores[owned]
         return score
 
-    def score_line(self, line, direction, board, player):
+    def score_line(self, line, direction, node, player):
         line_score = 0
-        for start in range(0, len(line) - 3):
-            partial_line = line[start:start + 4]
-            if not self.check_empty(partial_line, board):
-                line_score += self.score_partial_line(partial_line, direction, board, player)
+        connect = self.shape.connect
+        for start in range(0, len(line) - connect + 1):
+            partial_line = line[start:start + connect]
+            if not self.check_empty(partial_line, node):
+                line_score += self.score_partial_line(partial_line, direction, node, player)
         return line_score
 
-    def score_partial_line(self, partial_line, direction, board, player):
+    def score_partial_line(self, partial_line, direction, node, player):
         partial_line_score = 0
         square_scores = 0
+        mine, theirs = node[player - 1], node[2 - player]
         for (x, y) in partial_line:
-            if board[x][y] == player:
-                square_scores += scores[x][y]
+            if (mine >> self.cell_bits[x][y]) & 1:
+                square_scores += self.scores[x][y]
                 partial_line_score += 1
-            elif board[x][y] == self.switch_player(player):
+            elif (theirs >> self.cell_bits[x][y]) & 1:
                 return 0
-        return self.generate_score(partial_line_score, partial_line, direction, board)  # + square_scores
+        return self.generate_score(partial_line_score, partial_line, direction, node)  # + square_scores
 
-    def generate_score(self, score, partial_line, direction, board):
+    def generate_score(self, score, partial_line, direction, node):
+        connect = self.shape.connect
         if score == 0:
-            return 50 - (self.distance(partial_line, direction, board))
-        elif score >= 4:
-            return 5000 - (self.distance(partial_line, direction, board))
-        elif score == 3:
-            return 1000 - (self.distance(partial_line, direction, board))
-        elif score == 2:
-            return 500 - (self.distance(partial_line, direction, board))
+            return 50 - (self.distance(partial_line, direction, node))
+        elif score >= connect:
+            return 5000 - (self.distance(partial_line, direction, node))
+        elif score == connect - 1:
+            return 1000 - (self.distance(partial_line, direction, node))
+        elif score == connect - 2:
+            return 500 - (self.distance(partial_line, direction, node))
         else:
-            return 100 - (self.distance(partial_line, direction, board))
+            return 100 - (self.distance(partial_line, direction, node))
 
     @staticmethod
     def check_openings(line):
         pass
 
-    @staticmethod
-    def distance(partial_line, direction, board):
+    def distance(self, partial_line, direction, node):
         distance = 0
         if direction == (0, 1):  # If its a vertical line
-            return np.count_nonzero(partial_line)
+            # the number of non zero coordinates, what np.count_nonzero
+            # gives for the list of cells
+            return sum((x != 0) + (y != 0) for (x, y) in partial_line)
+        mask = node[0] | node[1]
         for (x, y) in partial_line:
-            while x <= 5 and board[x][y] != 0:
+            while x < self.shape.height and (mask >> self.cell_bits[x][y]) & 1:
                 x += 1
                 distance += 1
         return distance
 
-    def check_win(self, board):
-        for (line, (d1, d2)) in self.lines:
-            one, two = 0, 0
-            for (x, y) in line:
-                if board[x][y] == 1:
-                    one += 1
-                    two = 0
-                elif board[x][y] == 2:
-                    one = 0
-                    two += 1
-                else:
-                    one, two = 0, 0
-                if one >= 4:
-                    return 1
-                elif two >= 4:
-                    return 2
+    def check_win(self, node):
+        if self.has_won(node[0]):
+            return 1
+        elif self.has_won(node[1]):
+            return 2
+        return 0
+
+    def check_last_move(self, node, move, player):
+        """
+        Returns player if dropping the token at move (its bit) gave them four
+        (connect) in a row, 0 otherwise. Only the lines through that cell are
+        looked at, the position before the move was not won. With no move (0)
+        the whole board is checked.
+        """
+        if not move:
+            return self.check_win(node)
+        board = node[player - 1]
+        for (line_mask, shifts) in self.cell_lines[move]:
+            y = board & line_mask
+            for shift in shifts:
+                y &= y >> shift
+            if y:
+                return player
         return 0
 
 
+class WindowCounter:
+    def __init__(self, windows, node=(0, 0)):
+        """
+        Keeps the token count of both players in every window (AIPlayer's
+        windows) and the score_board total of both players up to date as
+        tokens are played and taken back, instead of rescanning the board.
+
+        counts[i] is [player 1 tokens, player 2 tokens] in window i.
+        """
+        self.windows = windows
+        self.cell_windows = {}  # move bit -> indexes of its windows
+        for (i, (window, direction, cells, scores)) in enumerate(windows):
+            bits = window
+            while bits:
+                move = bits & -bits
+                self.cell_windows.setdefault(move, []).append(i)
+                bits ^= move
+        self.node = [0, 0]
+        self.counts = [[0, 0] for _ in windows]
+        self.totals = [0, 0]
+        for p in (0, 1):
+            bitboard = node[p]
+            while bitboard:
+                move = bitboard & -bitboard
+                self.make(move, p + 1)
+                bitboard ^= move
+
+    def window_score(self, i, p):
+        """
+        Returns what window i adds to player p's (0 or 1) score_board.
+        """
+        if self.counts[i][1 - p] or not self.counts[i][p]:
+            return 0
+        window, direction, cells, scores = self.windows[i]
+        return scores[self.node[p] & window]
+
+    def update(self, move, player, step):
+        """
+        Plays (step 1) or takes back (step -1) player's token at move (its
+        bit), rescoring only the windows through that cell.
+        """
+        p = player - 1
+        indexes = self.cell_windows[move]
+        for i in indexes:
+            self.totals[0] -= self.window_score(i, 0)
+            self.totals[1] -= self.window_score(i, 1)
+        self.node[p] ^= move
+        for i in indexes:
+            self.counts[i][p] += step
+            self.totals[0] += self.window_score(i, 0)
+            self.totals[1] += self.window_score(i, 1)
+
+    def make(self, move, player):
+        self.update(move, player, 1)
+
+    def unmake(self, move, player):
+        self.update(move, player, -1)
+
+    def score(self, player):
+        """
+        Returns score_board(node, level, player) of the current node.
+        """
+        return self.totals[player - 1]
+
+
 class RandomPlayer:
     def __init__(self, player_number):
         self.player_number = player_number
@@ -309,6 +786,8 @@ class RandomPlayer:
         RETURNS:
         The 0 based index of the column that represents the next move
         """
+        import numpy as np  # kept off the import path of the AI players
+
         valid_cols = []
         for col in range(board.shape[1]):
             if 0 in board[:, col]:
@@ -318,16 +797,17 @@ class RandomPlayer:
 
 
 class HumanPlayer:
-    def __init__(self, player_number):
+    def __init__(self, player_number, shape=STANDARD):
         self.player_number = player_number
         self.type = 'human'
         self.player_string = 'Player {}:human'.format(player_number)
+        self.shape = shape
 
     def flipBit(self, board, p, x, y):
         """
         Flip the bit at the x/y location.
         """
-        board.BITBOARDS[p] |= (1 << (x * 7 + y))
+        board.BITBOARDS[p] |= (1 << self.shape.bit(x, y))
 
     def get_move(self, board):
         """
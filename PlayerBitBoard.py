@@ -1,14 +1,91 @@
+from time import perf_counter
+
 import Tree
-from BasePlayer import BasePlayer
+from BasePlayer import BasePlayer, popcount
+from BoardShape import STANDARD
+from GameState import GameState
+from MoveOrdering import MoveOrderer
+from Negamax import Negamax
+from OpeningBook import DEFAULT_PATH, open_book
+from ParallelSearch import RootSplitter
+from SearchControl import Deadline, SearchTimeout, search_budget, windowed_search
+from SearchStats import SearchStats
+from Solver import ENDGAME_CELLS, Solver
+from Symmetry import is_symmetric
+from TranspositionTable import TranspositionTable
 
 
 class AI(BasePlayer):
-    def __init__(self, player_number):
+    def __init__(self, player_number, tt_mb=16, time_limit=None,
+                 search_mode='tree', move_ordering=True, batch_eval=False,
+                 book_path=DEFAULT_PATH, endgame_cells=ENDGAME_CELLS,
+                 processes=None, pvs=False, driver='alphabeta', stats_path=None,
+                 pondering=False, reuse_tree=True, shape=STANDARD):
         self.player_number = player_number
         self.type = 'ai'
         self.player_string = 'Player {}:ai'.format(player_number)
+        # the BoardShape played on. Other shapes than the standard one swap
+        # the unrolled four in a row line tests for the shape's generic ones
+        self.shape = shape
+        self.board_mask = shape.board_mask
+        if shape != STANDARD:
+            self.has_won = shape.has_won
+            self.count_lines = shape.count_lines
+        self.max_depth = 7  # the depth searched when there is no time limit
+        # with a time limit (the turn limit in seconds) the search deepens
+        # iteratively until its share of the limit is used up
+        self.time_limit = time_limit
+        # 'tree' builds a Tree.Graph, 'negamax' searches without any nodes and
+        # 'parallel' splits the negamax root moves over processes processes
+        # (one per core by default)
+        self.search_mode = search_mode
+        self.splitter = RootSplitter(processes) if search_mode == 'parallel' else None
+        # with reuse_tree the tree mode keeps the last Tree.Graph and searches
+        # on from the node of the next position (see Tree.Graph.find), so the
+        # iterations of a move and the moves two plies apart share nodes
+        self.reuse_tree = reuse_tree
+        self.graph = None
+        # what the search of the last move did, appended to stats_path as a
+        # JSON line per move if it is set
+        self.stats = SearchStats()
+        self.stats_path = stats_path
+        # kept between moves, the positions of the last search come back
+        self.tt = TranspositionTable(tt_mb, shape=shape) if tt_mb else None
+        # killers/history/center-first ordering, None searches left to right
+        self.orderer = MoveOrderer(shape=shape) if move_ordering else None
+        # score the tree's leaves with numpy a frontier at a time, see
+        # Tree.Graph.evaluate_frontier (BatchEval is unrolled for the
+        # standard board)
+        self.batch_eval = batch_eval and shape == STANDARD
+        # precomputed moves of the first plies, None if there is no book (the
+        # book is for the standard board)
+        self.book = open_book(book_path) if shape == STANDARD else None
+        # with this many empty cells or fewer the position is solved exactly
+        # (0 never solves); the solver's table is kept between moves too
+        self.endgame_cells = endgame_cells
+        self.solver_tt = TranspositionTable(tt_mb, shape=shape) \
+            if tt_mb and endgame_cells else None
+        # principal variation search in the tree and negamax searches, and how
+        # their roots are searched: 'alphabeta', 'aspiration' (around the last
+        # depth's value) or 'mtdf', see SearchControl.windowed_search
+        self.pvs = pvs
+        self.driver = driver
+        self.value = None  # value of the last finished depth of this move
+        # with pondering an AIWorker keeps searching on the opponent's time,
+        # see ponder; pondered maps the positions it searched to the (depth,
+        # column) it got to, ponder_stats is what it did
+        self.pondering = pondering
+        self.pondered = {}
+        self.ponder_stats = SearchStats()
         BasePlayer.__init__(self, "CPU", True)
 
+    @property
+    def nodes(self):
+        """
+        Positions visited by the last search.
+        """
+        return self.stats.nodes
+
     @staticmethod
     def evaluate3(opp_board, my_board):
         """
@@ -159,6 +236,38 @@ class AI(BasePlayer):
 
         return i
 
+    @staticmethod
+    def count_lines(my_board, empty):
+        """
+        Returns how many empty cells would give my_board 3, 2 and 1 in a row,
+        the same numbers as bitboard_bits of evaluate3, evaluate2 and
+        evaluate1. empty is the mask of the empty playable cells.
+        Every shift of my_board is computed once and shared by the three.
+        Running time: O(1)
+        """
+        r6, l6 = my_board >> 6, my_board << 6
+        r7, l7 = my_board >> 7, my_board << 7
+        r8, l8 = my_board >> 8, my_board << 8
+        l1 = my_board << 1
+        l2 = my_board << 2
+
+        # XX on either side or around the cell: _XX, X_X, XX_
+        rr7, rl7, ll7 = r7 & (my_board >> 14), r7 & l7, l7 & (my_board << 14)
+        rr8, rl8, ll8 = r8 & (my_board >> 16), r8 & l8, l8 & (my_board << 16)
+        rr6, rl6, ll6 = r6 & (my_board >> 12), r6 & l6, l6 & (my_board << 12)
+        vertical2 = l1 & l2
+
+        three = (rr7 & ((my_board >> 21) | l7) | ll7 & ((my_board << 21) | r7)
+                 | rr8 & ((my_board >> 24) | l8) | ll8 & ((my_board << 24) | r8)
+                 | rr6 & ((my_board >> 18) | l6) | ll6 & ((my_board << 18) | r6)
+                 | vertical2 & (my_board << 3))
+        two = (rr7 | rl7 | ll7 | rr8 | rl8 | ll8 | rr6 | rl6 | ll6
+               | vertical2)
+        one = r7 | l7 | l1  # diagonals are skipped, like in evaluate1
+
+        return (popcount(empty & three), popcount(empty & two),
+                popcount(empty & one))
+
     def evalCost(self, b, opp_board, my_board, b_my_turn):
         """
         Returns cost of each board configuration.
@@ -179,26 +288,13 @@ class AI(BasePlayer):
         elif self.has_won(my_board):
             return win_reward
 
-        get3_win = self.evaluate3(opp_board, my_board)
-        winning3 = self.bitboard_bits(get3_win) * my_cost3_row
-
-        get3_block = self.evaluate3(my_board, opp_board)
-        blocking3 = self.bitboard_bits(get3_block) * -opp_cost3_row
-
-        get2_win = self.evaluate2(opp_board, my_board)
-        winning2 = self.bitboard_bits(get2_win) * my_cost2_row
-
-        get2_block = self.evaluate2(my_board, opp_board)
-        blocking2 = self.bitboard_bits(get2_block) * -opp_cost2_row
+        empty = ~(my_board | opp_board) & self.board_mask
+        my3, my2, my1 = self.count_lines(my_board, empty)
+        opp3, opp2, opp1 = self.count_lines(opp_board, empty)
 
-        get1_win = self.evaluate1(opp_board, my_board)
-        winning1 = self.bitboard_bits(get1_win) * my_cost1_row
-
-        get1_block = self.evaluate1(my_board, opp_board)
-        blocking1 = self.bitboard_bits(get1_block) * -opp_cost1_row
-
-        return winning3 + blocking3 + winning2 + blocking2 \
-               + winning1 + blocking1
+        return my3 * my_cost3_row - opp3 * opp_cost3_row \
+               + my2 * my_cost2_row - opp2 * opp_cost2_row \
+               + my1 * my_cost1_row - opp1 * opp_cost1_row
 
     def search(self, board):
         """
@@ -209,13 +305,245 @@ class AI(BasePlayer):
             otherwise:
                 raw minimax will be used to construct the tree (it may be
             required to lower the maxDepth because it will be slower).
+        When the AI has a time limit, the tree is searched to depth 1, 2, 3...
+        until the time is up, and the move of the last finished depth is used.
+        With search_mode 'negamax' no tree is built at all, see Negamax.
+        The two do not search the same thing: like the original tree,
+        Tree.Graph drops the AI's moves onto the opponent's board (and the
+        opponent's onto ours) and scores its leaves for that board's owner,
+        so in effect it searches the position with the tokens already played
+        swapped between the players. Negamax searches the position as it is
+        (and scores quicker wins higher), so the two modes can give different
+        root values and pick different moves.
+        Once few enough cells are empty the Solver plays perfectly instead.
         """
         my_board = board.BITBOARDS[board.current_turn]
         opp_board = board.BITBOARDS[(not board.current_turn)]
-        max_depth = 7
-        g = Tree.Graph(my_board, opp_board, max_depth)  # minimax graph
-        g.alphabeta(board, self, g.root, max_depth, float('-inf'), float('inf'))
-        return g.get_move()
+        self.value = None
+        deadline = None
+        if self.time_limit is not None:
+            deadline = Deadline(search_budget(self.time_limit))
+        if self.shape.cells - popcount(my_board | opp_board) <= self.endgame_cells:
+            col = self.solve(my_board, opp_board, deadline)
+            if col >= 0:
+                return self.stats.finish(col, 'solver', self.stats_path)
+        if self.tt is not None:
+            self.tt.new_search()
+        if self.orderer is not None:
+            self.orderer.new_search()
+        if self.time_limit is None:
+            col = self.search_depth(board, my_board, opp_board, self.max_depth)
+        else:
+            col = self.iterative_deepening(board, my_board, opp_board, deadline)
+        return self.stats.finish(col, 'search', self.stats_path)
+
+    def solve(self, my_board, opp_board, deadline=None):
+        """
+        Returns the column of perfect play, or -1 if the solver did not
+        finish in half of the time left before the deadline (the other half
+        is for the heuristic search).
+        """
+        if deadline is not None:
+            deadline = Deadline(deadline.remaining() / 2)
+        solver = Solver(self.solver_tt, deadline, self.shape)
+        try:
+            col, _ = solver.solve(my_board, opp_board)
+        except SearchTimeout:
+            col = -1
+        finally:
+            self.stats.add(solver)
+        return col
+
+    def search_depth(self, board, my_board, opp_board, max_depth,
+                     deadline=None, first_col=-1):
+        """
+        Searches the position max_depth plies deep with the search mode of
+        the AI and returns the best column. The root is searched with the
+        driver of the AI, the value of the previous depth being its guess.
+        """
+        start, nodes = perf_counter(), self.stats.nodes
+        if self.search_mode == 'parallel':
+            col = self.parallel_search(my_board, opp_board, max_depth,
+                                       deadline, first_col)
+        elif self.search_mode == 'negamax':
+            negamax = Negamax(self, deadline, self.orderer, self.tt, self.pvs)
+
+            def root_search(alpha, beta):
+                return negamax.search(board, my_board, opp_board, max_depth,
+                                      first_col, alpha, beta)
+            try:
+                col, self.value = windowed_search(root_search, self.driver,
+                                                  self.value)
+            finally:
+                self.stats.add(negamax)
+        elif self.driver == 'alphabeta' and not self.pvs:
+            g = self.tree_search(board, my_board, opp_board, max_depth,
+                                 deadline, first_col, float('-inf'), float('inf'))
+            self.value = g.root.value
+            col = g.get_move(self.shape)
+        else:
+            def root_search(alpha, beta):
+                g = self.tree_search(board, my_board, opp_board, max_depth,
+                                     deadline, first_col, alpha, beta)
+                return g.best_col, g.root.value
+            col, self.value = windowed_search(root_search, self.driver,
+                                              self.value)
+        self.stats.iteration(max_depth, self.stats.nodes - nodes,
+                             perf_counter() - start)
+        return col
+
+    def tree_search(self, board, my_board, opp_board, max_depth, deadline,
+                    first_col, alpha, beta):
+        """
+        Builds a Tree.Graph with alphabeta in the window (alpha, beta) and
+        returns it, the root's value set to the one alphabeta returned. With
+        reuse_tree it grows from the node of the position in the last one.
+        """
+        root = None
+        if self.reuse_tree and self.graph is not None:
+            root = self.graph.find(self, my_board, opp_board)
+        g = Tree.Graph(my_board, opp_board, max_depth, self.tt, deadline,
+                       self.orderer, self.batch_eval, self.pvs, root)  # minimax graph
+        if self.reuse_tree:
+            self.graph = g
+        g.first_col = first_col
+        try:
+            value = g.alphabeta(board, self, g.root, max_depth, alpha, beta)
+        finally:
+            self.stats.add(g)
+        # with a narrower window or null windows the node values are only
+        # bounds, the returned value is the one to go by
+        g.root.value = value
+        return g
+
+    def parallel_search(self, my_board, opp_board, max_depth, deadline=None,
+                        first_col=-1):
+        """
+        Searches the root moves max_depth plies deep on the splitter's pool
+        and returns the best column, the same one Negamax.search returns.
+        """
+        shape = self.shape
+        mask = my_board | opp_board
+        if self.orderer is not None:
+            order = self.orderer.order(range(shape.width), 0, first_col)
+        else:
+            order = sorted(range(shape.width), key=lambda c: c != first_col)
+        if is_symmetric(my_board, opp_board, shape):  # mirrored moves tie
+            order = [col for col in order if col <= (shape.width - 1) // 2]
+        moves = []
+        for col in order:
+            move = (mask + shape.bottom_bits[col]) & shape.column_masks[col]
+            if move:
+                moves.append((col, (opp_board, my_board | move), move))
+        try:
+            col, _ = self.splitter.search('negamax', self.player_number, moves,
+                                          max_depth, deadline, shape)
+        finally:
+            self.stats.add(self.splitter.stats)
+        return col
+
+    def iterative_deepening(self, board, my_board, opp_board, deadline=None):
+        """
+        Searches one ply deeper at a time until the time budget (or the
+        deadline) runs out. The best move of each depth is searched first in
+        the next one. The depths pondered already are skipped.
+        """
+        if deadline is None:
+            deadline = Deadline(search_budget(self.time_limit))
+        empty_cells = self.shape.cells - popcount(my_board | opp_board)
+        done, best_col = self.pondered.get((my_board, opp_board), (0, -1))
+        for max_depth in range(done + 1, empty_cells + 1):
+            try:
+                best_col = self.search_depth(board, my_board, opp_board,
+                                             max_depth, deadline, best_col)
+            except SearchTimeout:
+                break
+        if best_col < 0:  # not even depth 1 finished
+            best_col = self.get_legal_locations(my_board | opp_board)[0][0]
+        return best_col
+
+    def predicted_replies(self, my_board, opp_board):
+        """
+        Returns (column, opp board after it) of the opponent's replies that
+        don't win on the spot, in the order we expect them: the best reply
+        the last search found (from the transposition table) first, then by
+        move ordering.
+        """
+        shape = self.shape
+        mask = my_board | opp_board
+        hash_col = -1
+        if self.tt is not None:
+            # the tree keys its positions by our board, negamax by the board
+            # of the side to move
+            if self.search_mode == 'tree':
+                entry = self.tt.probe(self.tt.key(my_board, opp_board))
+            else:
+                entry = self.tt.probe(self.tt.key(opp_board, my_board))
+            if entry is not None:
+                hash_col = entry[4]
+        if self.orderer is not None:
+            cols = self.orderer.order(range(shape.width), 1, hash_col)
+        else:
+            cols = sorted(range(shape.width),
+                          key=lambda c: (c != hash_col, shape.center_order.index(c)))
+        replies = []
+        for col in cols:
+            move = (mask + shape.bottom_bits[col]) & shape.column_masks[col]
+            if move and not self.has_won(opp_board | move):
+                replies.append((col, opp_board | move))
+        return replies
+
+    def ponder(self, board, stop):
+        """
+        Searches on the opponent's time. board is the position after our
+        move (anything play takes), stop a SearchControl.Interrupt. The
+        opponent's replies are searched a depth at a time, the predicted one
+        first, until stop interrupts or they are all searched to the end: the
+        transposition tables keep what was found and pondered the depth and
+        column reached, so the search of the real reply starts from there.
+        The parallel mode does not ponder, its pool keeps nothing.
+        """
+        if isinstance(board, (bytes, bytearray)):
+            board = GameState.from_wire(board, self.shape)
+        self.pondered = {}
+        if self.search_mode == 'parallel':
+            return
+        opp_board = board.BITBOARDS[board.current_turn]  # the opponent moves
+        my_board = board.BITBOARDS[not board.current_turn]
+        replies = self.predicted_replies(my_board, opp_board)
+        if self.tt is not None:
+            self.tt.new_search()
+        if self.orderer is not None:
+            self.orderer.new_search()
+        empty_cells = self.shape.cells - popcount(my_board | opp_board) - 1
+        stats, self.stats = self.stats, SearchStats()
+        # each reply's tree grows from the node in the tree of our move, so
+        # the one played is found there again
+        graph = self.graph
+        try:
+            if empty_cells <= self.endgame_cells:
+                if self.solver_tt is not None:  # its table is kept
+                    for (_, reply_board) in replies:
+                        solver = Solver(self.solver_tt, stop, self.shape)
+                        try:
+                            solver.solve(my_board, reply_board)
+                        finally:
+                            self.stats.add(solver)
+                return
+            for max_depth in range(1, empty_cells + 1):
+                for (_, reply_board) in replies:
+                    key = (my_board, reply_board)
+                    best_col = self.pondered.get(key, (0, -1))[1]
+                    self.value = None
+                    self.graph = graph
+                    best_col = self.search_depth(None, my_board, reply_board,
+                                                 max_depth, stop, best_col)
+                    self.pondered[key] = (max_depth, best_col)
+        except SearchTimeout:
+            pass
+        finally:
+            self.graph = graph
+            self.ponder_stats, self.stats = self.stats, stats
 
     def forced_moves(self, board):
         """
@@ -243,25 +571,19 @@ class AI(BasePlayer):
 
     def play(self, board):
         """
-        Returns the column to place the piece in.
+        Returns the column to place the piece in, self.stats tells how it was
+        found. board is anything with BITBOARDS and current_turn (a Game or
+        GameState), or a position in wire format (see GameState.to_wire).
         """
+        if isinstance(board, (bytes, bytearray)):
+            board = GameState.from_wire(board, self.shape)
+        self.stats = SearchStats()
+        if self.book is not None:  # the opening book knows the early moves
+            entry = self.book.lookup(board.BITBOARDS[board.current_turn],
+                                     board.BITBOARDS[not board.current_turn])
+            if entry is not None:
+                return self.stats.finish(entry[0], 'book', self.stats_path)
         forced_column = self.forced_moves(board)  # if there is a forced move
-        if forced_column > -1:
-            return forced_column  # play it
+        if forced_column > -1:  # play it
+            return self.stats.finish(forced_column, 'forced', self.stats_path)
         return self.search(board)  # otherwise, search the tree
-
-    def has_won(self, bitboard):
-        # taken from http://stackoverflow.com/q/7033165/1524592
-        y = bitboard & (bitboard >> 6)
-        if y & (y >> 2 * 6):  # check \ diagonal
-            return True
-        y = bitboard & (bitboard >> 7)
-        if y & (y >> 2 * 7):  # check horizontal
-            return True
-        y = bitboard & (bitboard >> 8)
-        if y & (y >> 2 * 8):  # check / diagonal
-            return True
-        y = bitboard & (bitboard >> 1)
-        if y & (y >> 2):  # check vertical
-            return True
-        return False
@@ -0,0 +1,132 @@
+import time
+
+# share of the turn limit the searches are allowed to use, the rest covers
+# starting the worker and sending the move back
+BUDGET_FRACTION = 0.5
+
+
+class SearchTimeout(Exception):
+    """
+    Raised from inside a search when its time budget has run out. The
+    iteration that was running is thrown away.
+    """
+
+
+def search_budget(time_limit):
+    """
+    Returns the number of seconds a search may take for a turn limit of
+    time_limit seconds.
+    """
+    return time_limit * BUDGET_FRACTION
+
+
+class Deadline:
+    def __init__(self, seconds):
+        """
+        A wall-clock deadline for a search, seconds from now.
+        """
+        self.end = time.perf_counter() + seconds
+
+    @staticmethod
+    def until(end):
+        """
+        Returns the Deadline ending at the perf_counter time end, which is
+        the same clock in every process of the machine.
+        """
+        deadline = Deadline(0)
+        deadline.end = end
+        return deadline
+
+    def remaining(self):
+        return self.end - time.perf_counter()
+
+    def expired(self):
+        return time.perf_counter() >= self.end
+
+    def check(self):
+        """
+        Called at every node, raises SearchTimeout once the deadline passed.
+        """
+        if time.perf_counter() >= self.end:
+            raise SearchTimeout()
+
+
+# half width of the aspiration windows, in evaluation points (a three in a
+# row is worth 1000 to 3000)
+ASPIRATION_WINDOW = 500
+# how the root of each iteration is searched, see windowed_search
+DRIVERS = ('alphabeta', 'aspiration', 'mtdf')
+
+
+def windowed_search(search, driver='alphabeta', guess=None,
+                    width=ASPIRATION_WINDOW):
+    """
+    Searches a position with the driver and returns (column, value).
+    search(alpha, beta) must return the best column and a fail-soft integer
+    value: above alpha and below beta it is exact, otherwise it is a bound.
+        'alphabeta' searches the full window
+        'aspiration' searches guess +/- width first (guess is usually the
+            previous iteration's value), and again with the side that failed
+            opened up
+        'mtdf' closes in on the value with null window searches starting
+            from guess (0 if None), best with a transposition table
+    """
+    if driver == 'mtdf':
+        return mtdf(search, 0 if guess is None else guess)
+    if driver == 'aspiration' and guess is not None:
+        return aspiration(search, guess, width)
+    return search(-float('inf'), float('inf'))
+
+
+def aspiration(search, guess, width=ASPIRATION_WINDOW):
+    alpha, beta = guess - width, guess + width
+    while True:
+        col, value = search(alpha, beta)
+        if value <= alpha:
+            alpha = -float('inf')
+        elif value >= beta:
+            beta = float('inf')
+        else:
+            return col, value
+
+
+def mtdf(search, guess):
+    """
+    MTD(f): every null window search tells whether the value is above or
+    below a bound, until the lower and upper bounds meet. The column is
+    the one of the last search that failed high, it reaches the value.
+    """
+    lower, upper = -float('inf'), float('inf')
+    value, best_col = guess, -1
+    while lower < upper:
+        beta = value + 1 if value == lower else value
+        col, value = search(beta - 1, beta)
+        if value < beta:
+            upper = value
+        else:
+            lower = value
+            best_col = col
+    return best_col, value
+
+
+class Interrupt:
+    def __init__(self, pending, every=256):
+        """
+        Stops a search with no time limit (pondering) once pending() is true,
+        e.g. the poll of a worker's pipe, which tells that the next request
+        has arrived. It goes where a Deadline would. pending usually costs a
+        system call, so check only calls it every every nodes.
+        """
+        self.pending = pending
+        self.every = every
+        self.count = 0
+
+    def expired(self):
+        return self.pending()
+
+    def check(self):
+        self.count += 1
+        if self.count >= self.every:
+            self.count = 0
+            if self.pending():
+                raise SearchTimeout()
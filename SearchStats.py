@@ -0,0 +1,113 @@
+from time import perf_counter
+
+# the counters every search object keeps, summed by SearchStats.add
+COUNTERS = ('nodes', 'leaves', 'cutoffs', 'first_move_cutoffs', 'hits')
+
+
+class SearchStats:
+    def __init__(self):
+        """
+        What the engine did to pick one move. The searches only bump their
+        own integer counters, which are added in here once they finish, so
+        keeping the stats on costs next to nothing:
+            nodes: positions visited
+            leaves: positions scored by the evaluation function
+            cutoffs: beta cutoffs, first_move_cutoffs the ones the first
+                move searched caused (the closer the two, the better the
+                move ordering)
+            hits: positions found in a transposition table or memo
+            iterations: (depth, nodes, seconds) of every finished depth
+            source: what picked the move, 'book', 'win' (AIPlayer's winning
+                move), 'forced' (PlayerBitBoard.AI's win or block), 'solver'
+                or 'search'
+        """
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hits = 0
+        self.iterations = []
+        self.source = None
+        self.col = -1
+        self.start = perf_counter()
+        self.seconds = 0.0
+
+    def add(self, search):
+        """
+        Adds the counters of a search object (Negamax, Tree.Graph, Solver,
+        Expectimax, another SearchStats...) to these ones.
+        """
+        self.nodes += search.nodes
+        self.leaves += search.leaves
+        self.cutoffs += search.cutoffs
+        self.first_move_cutoffs += search.first_move_cutoffs
+        self.hits += search.hits
+
+    def cutoff(self, index):
+        """
+        Counts a beta cutoff by the index-th move searched, for the engines
+        that search without a search object of their own.
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+    def iteration(self, depth, nodes, seconds):
+        """
+        Records a finished search of depth plies, nodes and seconds being
+        what that depth alone took.
+        """
+        self.iterations.append((depth, nodes, seconds))
+
+    def branching_factor(self):
+        """
+        Returns the effective branching factor: how many times more nodes
+        the last depth took than the one before (the depth-th root of its
+        nodes if there is only one), 0 if nothing was searched.
+        """
+        if len(self.iterations) >= 2 and self.iterations[-2][1]:
+            return self.iterations[-1][1] / self.iterations[-2][1]
+        if self.iterations and self.iterations[-1][0] > 0:
+            depth, nodes = self.iterations[-1][:2]
+            return nodes ** (1 / depth)
+        return 0.0
+
+    def first_move_cutoff_rate(self):
+        if not self.cutoffs:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
+
+    def finish(self, col, source, path=None):
+        """
+        Records the move that was picked and how, and appends the stats to
+        the JSON lines file at path if there is one. Returns col.
+        """
+        self.col = col
+        self.source = source
+        self.seconds = perf_counter() - self.start
+        if path is not None:
+            self.write(path)
+        return col
+
+    def to_dict(self):
+        stats = {name: getattr(self, name) for name in COUNTERS}
+        stats.update({
+            'col': int(self.col),
+            'source': self.source,
+            'seconds': self.seconds,
+            'depth': self.iterations[-1][0] if self.iterations else 0,
+            'branching_factor': self.branching_factor(),
+            'first_move_cutoff_rate': self.first_move_cutoff_rate(),
+            'iterations': [{'depth': depth, 'nodes': nodes, 'seconds': seconds}
+                           for (depth, nodes, seconds) in self.iterations],
+        })
+        return stats
+
+    def write(self, path):
+        """
+        Appends the stats to path as one line of JSON.
+        """
+        import json  # only needed when the stats are written
+
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.to_dict()) + '\n')
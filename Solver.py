@@ -0,0 +1,185 @@
+from BoardShape import STANDARD, popcount
+from Symmetry import is_symmetric
+from TranspositionTable import EXACT, LOWER, UPPER, TranspositionTable
+
+BOARD_MASK = STANDARD.board_mask  # the 42 playable bits
+# the empty-cell count at or below which the engines solve instead of search
+ENDGAME_CELLS = 16
+
+
+def winning_cells(bitboard, mask):
+    """
+    Returns the empty cells (playable or not yet) that would give the owner
+    of bitboard four in a row. mask is every occupied cell. This is the
+    standard board's, BoardShape.winning_cells is for the others.
+    Running time: O(1)
+    """
+    # vertical, only from above
+    cells = (bitboard << 1) & (bitboard << 2) & (bitboard << 3)
+    for shift in (7, 6, 8):  # horizontal, \ diagonal, / diagonal
+        pair = (bitboard << shift) & (bitboard << 2 * shift)
+        cells |= pair & (bitboard << 3 * shift)  # XXX_
+        cells |= pair & (bitboard >> shift)  # XX_X
+        pair = (bitboard >> shift) & (bitboard >> 2 * shift)
+        cells |= pair & (bitboard << shift)  # X_XX
+        cells |= pair & (bitboard >> 3 * shift)  # _XXX
+    return cells & (BOARD_MASK ^ mask)
+
+
+def outcome(score):
+    """
+    Returns 1, 0 or -1 for a won, drawn or lost solver score.
+    """
+    return (score > 0) - (score < 0)
+
+
+class Solver:
+    def __init__(self, tt=None, deadline=None, shape=STANDARD):
+        """
+        Solves positions exactly: a negamax search to the end of the game
+        with win/draw/loss scores instead of the evaluation functions, for
+        the endgame where the heuristic searches would only be guessing.
+
+        A win scores 1 + the number of empty cells left after the winning
+        move, so quicker wins score higher; a loss is the opposite and a
+        draw is 0. tt is the TranspositionTable to use (one of 16MB by
+        default, kept by the engines between moves: the scores do not depend
+        on the search that found them). deadline is an optional
+        SearchControl.Deadline. shape is the BoardShape of the board.
+        """
+        self.tt = tt if tt is not None else TranspositionTable(shape=shape)
+        self.shape = shape
+        self.cells = shape.cells
+        self.winning_cells = winning_cells if shape == STANDARD else shape.winning_cells
+        self.deadline = deadline
+        self.nodes = 0  # number of positions searched
+        self.leaves = 0  # always 0, the solver never guesses
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hits = 0  # positions found in the transposition table
+
+    def non_losing_moves(self, my_board, opp_board, mask):
+        """
+        Returns the playable cells (as a bitboard) that don't let the
+        opponent win right away: the block if there is exactly one threat,
+        nothing if there are two, and never the cell below a threat.
+        """
+        possible = (mask + self.shape.bottom_mask) & self.shape.board_mask
+        opp_wins = self.winning_cells(opp_board, mask)
+        forced = possible & opp_wins
+        if forced:
+            if forced & (forced - 1):  # two threats, can't block both
+                return 0
+            possible = forced
+        return possible & ~(opp_wins >> 1)
+
+    def ordered_moves(self, my_board, mask, moves):
+        """
+        Returns (column, move) of the cells in moves, the ones creating the
+        most threats first, then from the center out.
+        """
+        scored = []
+        column_masks = self.shape.column_masks
+        for col in self.shape.center_order:
+            move = moves & column_masks[col]
+            if move:
+                threats = popcount(self.winning_cells(my_board | move, mask | move))
+                scored.append((-threats, len(scored), col, move))
+        scored.sort()
+        return [(col, move) for (_, _, col, move) in scored]
+
+    def solve(self, my_board, opp_board):
+        """
+        Returns (column, score) of the best move for the player owning
+        my_board, who is to move. Nobody may have four in a row already.
+        """
+        shape = self.shape
+        mask = my_board | opp_board
+        empty = self.cells - popcount(mask)
+        possible = (mask + shape.bottom_mask) & shape.board_mask
+        wins = possible & self.winning_cells(my_board, mask)
+        if wins:
+            return (popcount((wins & -wins) - 1) // shape.column_bits, empty)
+        moves = self.non_losing_moves(my_board, opp_board, mask)
+        if not moves:  # lost whatever we do, play on
+            return (popcount((possible & -possible) - 1) // shape.column_bits,
+                    1 - empty)
+        if is_symmetric(my_board, opp_board, shape):  # mirrored moves tie
+            moves &= shape.left_half
+
+        alpha, beta = -empty, empty
+        best_col, best_value = -1, -empty
+        for (col, move) in self.ordered_moves(my_board, mask, moves):
+            value = -self.negamax(opp_board, my_board | move, -beta, -alpha)
+            if value > best_value:
+                best_col, best_value = col, value
+            alpha = max(alpha, value)
+        return best_col, best_value
+
+    def negamax(self, my_board, opp_board, alpha, beta):
+        """
+        Returns the score of the position for the player to move (owning
+        my_board) if it is within (alpha, beta), otherwise a bound on the
+        side it fell out of. The last move did not win, nor can the player
+        to move win right away (solve and the parent check that).
+        """
+        self.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        mask = my_board | opp_board
+        empty = self.cells - popcount(mask)
+        if not empty:  # the last move filled the board without winning
+            return 0
+        moves = self.non_losing_moves(my_board, opp_board, mask)
+        if not moves:  # the opponent wins with its next move
+            return 1 - empty
+        if empty <= 2:  # neither of the last two moves can win
+            return 0
+
+        # the opponent can't win with its next move, nor can we before ours
+        # after that
+        low, high = 3 - empty, empty - 2
+        alpha, beta = max(alpha, low), min(beta, high)
+        if alpha >= beta:
+            return alpha
+
+        key = TranspositionTable.key(my_board, opp_board)
+        entry = self.tt.probe(key)
+        hash_col = -1
+        if entry is not None:
+            self.hits += 1
+            flag, value, hash_col = entry[2], entry[3], entry[4]
+            if flag == EXACT:
+                return value
+            elif flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        alpha_orig = alpha
+        best_value, best_col = -empty, -1
+        ordered = self.ordered_moves(my_board, mask, moves)
+        if hash_col >= 0:
+            ordered.sort(key=lambda c: c[0] != hash_col)
+        for (index, (col, move)) in enumerate(ordered):
+            value = -self.negamax(opp_board, my_board | move, -beta, -alpha)
+            if value > best_value:
+                best_value, best_col = value, col
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if index == 0:
+                            self.first_move_cutoffs += 1
+                        break
+
+        if best_value <= alpha_orig:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, empty, flag, best_value, best_col)
+        return best_value
@@ -0,0 +1,46 @@
+from BoardShape import STANDARD
+
+# the bits of each column of the BasePlayer layout, spare bit included
+C0, C1, C2, C3, C4, C5, C6 = (0x7F << (col * 7) for col in range(7))
+
+
+def mirror(bitboard):
+    """
+    Returns the bitboard flipped left to right, column c becomes column 6 - c.
+    Works for the position keys too, since a key's columns don't carry into
+    each other. This is the standard board's, BoardShape.mirror flips the
+    others.
+    """
+    return ((bitboard & C0) << 42 | (bitboard & C1) << 28
+            | (bitboard & C2) << 14 | bitboard & C3
+            | (bitboard & C4) >> 14 | (bitboard & C5) >> 28
+            | (bitboard & C6) >> 42)
+
+
+def mirror_col(col, shape=STANDARD):
+    return shape.width - 1 - col if col >= 0 else col
+
+
+def canonical(key, shape=STANDARD):
+    """
+    Returns (canonical key, mirrored): the smaller of the key and its mirror
+    image, which both orientations of a position share, and whether it is
+    the mirror image (a column stored under it has to be mirrored back).
+    """
+    if shape is STANDARD or shape == STANDARD:
+        mirrored_key = mirror(key)
+    else:
+        mirrored_key = shape.mirror(key)
+    if mirrored_key < key:
+        return mirrored_key, True
+    return key, False
+
+
+def is_symmetric(board1, board2, shape=STANDARD):
+    """
+    Returns whether the position looks the same in the mirror, then the
+    columns right of the center need not be searched.
+    """
+    if shape != STANDARD:
+        return shape.mirror(board1) == board1 and shape.mirror(board2) == board2
+    return mirror(board1) == board1 and mirror(board2) == board2
@@ -0,0 +1,137 @@
+# system libs
+import argparse
+import json
+import multiprocessing as mp
+
+# 3rd party libs
+import numpy as np
+
+# Local libs
+from ConnectFour import Game
+from Player import AIPlayer, RandomPlayer
+from PlayerBitBoard import AI
+from PlayerOld import AIPlayer as OldAIPlayer
+
+ENGINES = {
+    'ai': lambda num, time: AIPlayer(num, time),
+    'bitboard': lambda num, time: AI(num, time_limit=time),
+    'old': lambda num, time: OldAIPlayer(num),
+    'random': lambda num, time: RandomPlayer(num),
+}
+
+
+def labels(engine1, engine2):
+    """
+    Returns the names the two engines are recorded under: their own, or
+    engine#1 and engine#2 when both play the same engine, so that a self-play
+    match is tallied per seat and adds up to the number of games.
+    """
+    if engine1 == engine2:
+        return engine1 + '#1', engine2 + '#2'
+    return engine1, engine2
+
+
+def play_match(match):
+    """
+    Plays one headless game and returns its record. match is a tuple of
+    (game index, first engine, second engine, time limit, seed): the engines
+    take turns moving first, engine1 starts the even games. The record names
+    the engines by their labels.
+    """
+    index, engine1, engine2, time, seed = match
+    np.random.seed(seed)  # RandomPlayer, every pool process starts the same
+    seats = list(zip((engine1, engine2), labels(engine1, engine2)))
+    if index % 2 == 1:
+        seats.reverse()
+    (first_engine, first), (second_engine, second) = seats
+    game = Game(ENGINES[first_engine](1, time), ENGINES[second_engine](2, time),
+                time, headless=True)
+    winner = game.play()
+    return {
+        'game': index,
+        'players': [first, second],
+        'winner': [None, first, second][winner],
+        'moves': game.state.moves,
+        'move_times': [{'player': [first, second][player - 1],
+                        'column': int(column),
+                        'seconds': seconds}
+                       for (player, column, seconds) in game.move_times],
+        'move_stats': [dict(stats, player=[first, second][player - 1])
+                       for (player, stats) in game.move_stats
+                       if stats is not None],
+    }
+
+
+def summarize(records, time=None):
+    """
+    Returns the wins, losses and draws of every engine (by label, see
+    labels), how many of the wins came when moving first, and its move times
+    (moves longer than the time limit are counted as timeouts).
+    """
+    summary = {}
+    for record in records:
+        for (seat, engine) in enumerate(record['players']):
+            stats = summary.setdefault(engine, {
+                'wins': 0, 'losses': 0, 'draws': 0, 'wins_moving_first': 0,
+                'moves': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                'timeouts': 0})
+            if record['winner'] is None:
+                stats['draws'] += 1
+            elif record['winner'] == engine:
+                stats['wins'] += 1
+                stats['wins_moving_first'] += seat == 0
+            else:
+                stats['losses'] += 1
+    for record in records:
+        for move in record['move_times']:
+            stats = summary[move['player']]
+            stats['moves'] += 1
+            stats['total_seconds'] += move['seconds']
+            stats['max_seconds'] = max(stats['max_seconds'], move['seconds'])
+            if time is not None and move['seconds'] > time:
+                stats['timeouts'] += 1
+    for stats in summary.values():
+        stats['mean_seconds'] = stats['total_seconds'] / max(1, stats['moves'])
+    return summary
+
+
+def run_tournament(engine1, engine2, games, time=None, processes=None, seed=0):
+    """
+    Plays games games between engine1 and engine2 (keys of ENGINES) spread
+    over a pool of processes, one per core by default.
+    """
+    matches = [(i, engine1, engine2, time, seed + i) for i in range(games)]
+    with mp.Pool(processes or mp.cpu_count()) as pool:
+        records = pool.map(play_match, matches, chunksize=1)
+    return {
+        'engines': [engine1, engine2],
+        'time_limit': time,
+        'summary': summarize(records, time),
+        'games': records,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('engine1', choices=sorted(ENGINES))
+    parser.add_argument('engine2', choices=sorted(ENGINES))
+    parser.add_argument('--games', type=int, default=10,
+                        help='Number of games to play (int)')
+    parser.add_argument('--time', type=float, default=None,
+                        help='Turn limit in seconds, the engines that '
+                             'support it deepen iteratively (float)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Size of the process pool (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random players (int)')
+    parser.add_argument('--out', default='tournament.json',
+                        help='File to write the results to')
+    args = parser.parse_args()
+
+    results = run_tournament(args.engine1, args.engine2, args.games, args.time,
+                             args.processes, args.seed)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    for engine, stats in sorted(results['summary'].items()):
+        print('{}: {wins} wins, {losses} losses, {draws} draws, '
+              '{mean_seconds:.3f}s per move'.format(engine, **stats))
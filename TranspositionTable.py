@@ -0,0 +1,123 @@
+from BoardShape import STANDARD
+from Symmetry import canonical, mirror_col
+
+EXACT = 0  # the stored value is the true minimax value
+LOWER = 1  # the stored value is a lower bound (the search failed high)
+UPPER = 2  # the stored value is an upper bound (the search failed low)
+
+# rough size in bytes of one stored entry (the tuple + its small ints)
+ENTRY_BYTES = 128
+
+
+def next_prime(n):
+    """
+    Returns the smallest prime number greater or equal to n.
+    """
+    def is_prime(x):
+        if x < 2:
+            return False
+        i = 2
+        while i * i <= x:
+            if x % i == 0:
+                return False
+            i += 1
+        return True
+
+    while not is_prime(n):
+        n += 1
+    return n
+
+
+class TranspositionTable:
+    def __init__(self, max_mb=16, symmetric=True, shape=STANDARD):
+        """
+        A bounded transposition table for the bitboard searches. Connect Four
+        reaches the same position through many move orders, so we remember
+        the result of every searched position and reuse it when it shows up
+        again.
+
+        max_mb is the memory cap in megabytes, it sets the number of slots.
+        The table is direct mapped (one entry per slot), each entry is a
+        tuple of (key, depth, flag, value, col, age):
+            key is the compact position key (see TranspositionTable.key)
+            depth is the remaining depth the value was searched to
+            flag is one of EXACT, LOWER or UPPER
+            value is the value found by the search
+            col is the best column found (or -1)
+            age is the search that stored the entry
+
+        With symmetric, a position and its mirror image share their entry:
+        it is stored under the canonical key (see Symmetry.canonical) and its
+        column is mirrored on the way in and out when needed. shape is the
+        BoardShape of the positions.
+
+        When two positions land in the same slot, the new entry replaces the
+        old one if the old one is from a previous search, or if it was not
+        searched deeper than the new one (depth-preferred, age-based).
+        """
+        # a prime number of slots, so that key % size uses every column of
+        # the key rather than only the lowest ones
+        self.size = next_prime(max(2, int(max_mb * 1024 * 1024) // ENTRY_BYTES))
+        self.slots = [None] * self.size
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.symmetric = symmetric
+        self.shape = shape
+
+    @staticmethod
+    def key(my_board, opp_board):
+        """
+        Returns a compact key for the position. Adding the mask of all the
+        tokens to one player's tokens gives a number that is unique for every
+        position and fits in 49 bits (BoardShape.bits): within each column
+        the sum is the column's tokens with an extra bit on top of them.
+        """
+        return my_board + (my_board | opp_board)
+
+    def new_search(self):
+        """
+        Called once per search, entries from older searches become the first
+        to be replaced.
+        """
+        self.age += 1
+
+    def probe(self, key):
+        """
+        Returns the entry for the key, or None if it is not in the table.
+        """
+        self.probes += 1
+        mirrored = False
+        if self.symmetric:
+            key, mirrored = canonical(key, self.shape)
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            if mirrored:
+                return entry[:4] + (mirror_col(entry[4], self.shape), entry[5])
+            return entry
+        return None
+
+    def store(self, key, depth, flag, value, col):
+        """
+        Stores the search result of a position using the replacement policy
+        described above.
+        """
+        if self.symmetric:
+            key, mirrored = canonical(key, self.shape)
+            if mirrored:
+                col = mirror_col(col, self.shape)
+        index = key % self.size
+        entry = self.slots[index]
+        if entry is None or entry[0] == key or entry[5] != self.age \
+                or depth >= entry[1]:
+            self.slots[index] = (key, depth, flag, value, col, self.age)
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
@@ -1,24 +1,52 @@
+from BoardShape import STANDARD
+from Symmetry import is_symmetric
+from TranspositionTable import EXACT, LOWER, UPPER
+
+
 class Graph:
 
-    def __init__(self, my_board, opp_board, max_depth):
-        # initiate the first/root node to be at depth 0 and pointing to itself
-        root_node = Node(my_board, opp_board, 0, -1, -1)
+    def __init__(self, my_board, opp_board, max_depth, tt=None, deadline=None,
+                 orderer=None, batch_eval=False, pvs=False, root=None):
+        # initiate the first/root node to be at depth 0 and pointing to itself,
+        # or search on from a node kept from an earlier search (see find)
+        root_node = root if root is not None else Node(my_board, opp_board, 0, -1, -1)
         self.root = root_node
+        # the depth of the root, the plies of a node are counted from there
+        self.base = root_node.depth
         self.maxDepth = max_depth  # the max depth to consider moves
+        self.tt = tt  # optional TranspositionTable shared between searches
+        self.deadline = deadline  # optional SearchControl.Deadline
+        self.first_col = -1  # root column to search first (-1 for none)
+        self.orderer = orderer  # optional MoveOrdering.MoveOrderer
+        self.nodes = 0  # number of alphabeta calls
+        # what the search did, see SearchStats
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hits = 0  # positions found in the transposition table
+        # evaluate the leaves two plies down in one BatchEval call
+        self.batch_eval = batch_eval
+        # principal variation search: only the first child of a node gets the
+        # full window, see search_child
+        self.pvs = pvs
+        self.best_col = -1  # the root's best column, set by alphabeta
 
-    def get_move(self):
+    def get_move(self, shape=STANDARD):
         """
         This function simply returns the column from the minimax graphs's top
         values. In the case there is more than one column equally-well rated,
-        we will the one closest to the center.
+        we will the one closest to the center of the shape's board (the left
+        one of two as close).
         """
         best_value = self.root.value
         root_children = self.root.children
-        best_columns = [c.col for c in root_children if c.value == best_value]
+        # a child cut off with the same bound as the best value did not tie it
+        best_columns = [c.col for c in root_children
+                        if c.value == best_value and c.flag == EXACT]
         if best_columns:
             if len(best_columns) > 1:
                 # return the column closest to the center, if they are all equal
-                return min(best_columns, key=lambda x: 3-x)
+                return min(best_columns, key=shape.center_order.index)
             else:
                 return best_columns[0]
         raise Exception("Failed to find best value")
@@ -76,6 +104,34 @@ class Graph:
         parent_node.children = children_nodes
         parent_node.setValueFromChildren()
 
+    def find(self, ai, my_board, opp_board):
+        """
+        Returns the node of the position (my_board, opp_board) if it is the
+        root or two plies below it (our move and the opponent's reply since
+        the search that built this graph), None otherwise. The node keeps its
+        subtree: a Graph rooted there (see the root argument) starts from the
+        children, values, bounds and best moves found so far instead of from
+        scratch. Nodes the search never got to are created on the way.
+        """
+        node = self.root
+        for _ in range(2):
+            if (node.myBoard, node.oppBoard) == (my_board, opp_board):
+                break
+            if node.myBoard & ~my_board or node.oppBoard & ~opp_board:
+                return None  # not on the way to the position
+            if not node.children:
+                self.create_node_children(ai, node)
+            # the one child holding no token the position doesn't have
+            node = next((c for c in node.children
+                         if not (c.myBoard & ~my_board or c.oppBoard & ~opp_board)),
+                        None)
+            if node is None:
+                return None
+        if (node.myBoard, node.oppBoard) != (my_board, opp_board):
+            return None
+        node.parent = node  # let the rest of the old tree go
+        return node
+
     @staticmethod
     def create_node_children(ai, node):
         """
@@ -98,6 +154,57 @@ class Graph:
             children_nodes.append(child_node)
         node.children = children_nodes
 
+    def evaluate_frontier(self, ai, node):
+        """
+        Creates the children and grandchildren of a node two plies above the
+        leaves and scores all the grandchildren with one BatchEval.evaluate
+        call, instead of one evalCost call per leaf as alphabeta gets to it.
+        Some of them would have been cut off, so it only pays off when numpy
+        is quicker than evalCost on the ~49 leaves than on the few visited.
+        """
+        import BatchEval
+
+        if not node.children:
+            self.create_node_children(ai, node)
+        leaves = []
+        for child in node.children:
+            if not child.children:
+                self.create_node_children(ai, child)
+            # the ones kept from an earlier search are scored already
+            leaves.extend(c for c in child.children if c.eval is None)
+        if not leaves:
+            return
+        # the leaves are scored like alphabeta does, with the boards swapped
+        values = BatchEval.evaluate([leaf.oppBoard for leaf in leaves],
+                                    [leaf.myBoard for leaf in leaves])
+        for leaf, value in zip(leaves, values.tolist()):
+            leaf.eval = value
+
+    def order_children(self, node, hash_col):
+        """
+        Sorts the children of the node with the move orderer, so the most
+        promising columns are searched first.
+        """
+        by_col = {child.col: child for child in node.children}
+        cols = self.orderer.order(list(by_col), node.depth - self.base, hash_col)
+        node.children = [by_col[col] for col in cols]
+
+    def search_child(self, b, ai, child, depth, alpha, beta, is_turn, first):
+        """
+        Searches a child with alphabeta. With pvs every child but the first
+        gets a null window: it only has to show it is no better than the
+        best one so far, and is searched again with the full window if it is.
+        """
+        if first or not self.pvs:
+            return self.alphabeta(b, ai, child, depth, alpha, beta)
+        if is_turn:
+            value = self.alphabeta(b, ai, child, depth, alpha, alpha + 1)
+        else:
+            value = self.alphabeta(b, ai, child, depth, beta - 1, beta)
+        if alpha < value < beta:
+            value = self.alphabeta(b, ai, child, depth, alpha, beta)
+        return value
+
     def alphabeta(self, b, ai, node, depth, alpha, beta):
         """
         Constructs the tree using alphabeta, this is quite similar to the raw
@@ -110,35 +217,111 @@ class Graph:
         On my laptop, this equates to an increase from depth 5 to 7 for a max
         wait of ~2 seconds over non-optimized minimax.
         """
-        is_turn = node.depth % 2 == 0  # if it's the AI's turn, we should maxmize
-        if depth == 0 or node.depth == self.maxDepth:
-            if node.value is None:
-                node.value = ai.evalCost(b, node.myBoard, node.oppBoard, is_turn)
+        self.nodes += 1
+        if self.deadline is not None:
+            self.deadline.check()
+        ply = node.depth - self.base
+        is_turn = ply % 2 == 0  # if it's the AI's turn, we should maxmize
+        if depth == 0 or ply == self.maxDepth:
+            self.leaves += 1
+            if node.eval is None:
+                node.eval = ai.evalCost(b, node.myBoard, node.oppBoard, is_turn)
+            node.value, node.flag, node.remaining = node.eval, EXACT, 0
             return node.value
 
-        self.create_node_children(ai, node)
+        # a node kept from an earlier search is its own transposition table
+        # entry, otherwise look the position up in the table. The root is
+        # always searched since get_move needs the values of its children
+        alpha_orig, beta_orig = alpha, beta
+        remaining = min(depth, self.maxDepth - ply)
+        key, hash_col, bound = None, node.best_col, None
+        if ply > 0 and node.remaining >= remaining:
+            self.hits += 1
+            bound = node.flag, node.value, node.remaining
+        if self.tt is not None:
+            key = self.tt.key(node.myBoard, node.oppBoard)
+            entry = self.tt.probe(key) if bound is None else None
+            if entry is not None:
+                self.hits += 1
+                hash_col = entry[4]
+                if ply > 0 and entry[1] >= remaining:
+                    bound = entry[2], entry[3], entry[1]
+        if bound is not None:
+            flag, value, searched = bound
+            if flag == EXACT:
+                node.value, node.flag, node.remaining = value, EXACT, searched
+                return value
+            elif flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if beta <= alpha:
+                node.value, node.flag, node.remaining = value, flag, searched
+                return value
+
+        if self.batch_eval and remaining == 2:
+            self.evaluate_frontier(ai, node)
+        elif not node.children:  # evaluate_frontier may have made them
+            self.create_node_children(ai, node)
+        if ply == 0 and is_symmetric(node.myBoard, node.oppBoard, ai.shape):
+            # a move and its mirror image are worth the same, keep one of each
+            center = (ai.shape.width - 1) // 2
+            node.children = [c for c in node.children if c.col <= center]
+        if ply == 0 and self.first_col >= 0:
+            hash_col = self.first_col
+        if self.orderer is not None:
+            self.order_children(node, hash_col)
+        elif hash_col >= 0:  # search the best move from the table first
+            node.children.sort(key=lambda c: c.col != hash_col)
+        best_col = -1
+        # every node keeps the value it returned: exact if it is within
+        # (alpha, beta), otherwise the bound its flag says
         if is_turn:
             v = float('-inf')
-            for child in node.children:
-                v = max(v, self.alphabeta(b, ai, child, depth-1, alpha, beta))
+            for index, child in enumerate(node.children):
+                child_value = self.search_child(b, ai, child, depth-1, alpha,
+                                                beta, True, index == 0)
+                if child_value > v:
+                    v, best_col = child_value, child.col
                 alpha = max(alpha, v)
-                if node.value is None or alpha > node.value:
-                    node.value = alpha
                 if beta <= alpha:
-                    node.value = None
+                    self.count_cutoff(index)
+                    if self.orderer is not None:
+                        self.orderer.cutoff(child.col, ply, index, remaining)
                     break
-            return v
         else:
             v = float('inf')
-            for child in node.children:
-                v = min(v, self.alphabeta(b, ai, child, depth-1, alpha, beta))
+            for index, child in enumerate(node.children):
+                child_value = self.search_child(b, ai, child, depth-1, alpha,
+                                                beta, False, index == 0)
+                if child_value < v:
+                    v, best_col = child_value, child.col
                 beta = min(beta, v)
-                if node.value is None or beta < node.value:
-                    node.value = beta
                 if beta <= alpha:
-                    node.value = None
+                    self.count_cutoff(index)
+                    if self.orderer is not None:
+                        self.orderer.cutoff(child.col, ply, index, remaining)
                     break
-            return v
+
+        if v <= alpha_orig:
+            flag = UPPER
+        elif v >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        node.value, node.flag, node.remaining = v, flag, remaining
+        if best_col >= 0:
+            node.best_col = best_col
+        if ply == 0:
+            self.best_col = best_col
+        if key is not None:
+            self.tt.store(key, remaining, flag, v, best_col)
+        return v
+
+    def count_cutoff(self, index):
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
 
 
 class Node:
@@ -146,6 +329,14 @@ class Node:
         self.myBoard = my_board
         self.oppBoard = opp_board
         self.value = value
+        # EXACT, or LOWER/UPPER if alphabeta only got a bound on the value
+        self.flag = EXACT
+        # what alphabeta found, kept for the next searches through the node
+        # (see Graph.find): how many plies below it value was searched to
+        # (-1 for not yet) and the best column
+        self.remaining = -1
+        self.best_col = -1
+        self.eval = None  # the evaluation function's score, once computed
         self.depth = depth
         if depth == 0:  # if the node is the root
             self.parent = self  # set the parent node to itself